@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""
+Debt compression on large sparse exposure graphs.
+
+debt_compression_question.ipynb (Examples/bonus) nets the debts of four
+friends, stored as a dense upper triangle, and checks answers with Python
+loops.  compress() takes an edge list instead, with src[k] owing dst[k]
+the amount amount[k], and finds new amounts on the same counterparty pairs
+that leave every party's net position unchanged while minimizing either
+the total debt (norm=1, an LP for handle_solve_lp_ipm, which favours
+few payments) or the sum of squared debts (norm=2, a QP for
+handle_solve_socp_ipm, which favours small payments).  The constraint
+matrix is the sparse node-edge incidence matrix, so the models scale to
+tens of thousands of parties; net positions are checked with np.bincount.
+
+Run this file for a benchmark over the number of parties and the number
+of debts per party.
+
+Example, the four friends of the notebook (Tom, Zoe, John, David):
+
+    src = [0, 1, 1, 3, 3, 2]
+    dst = [1, 3, 2, 0, 2, 0]
+    amount = [30., 55., 15., 45., 45., 35.]
+    res = compress(src, dst, amount, 4)
+    res.src, res.dst, res.amount, res.max_net_error
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from sparse_lp import build_lp
+
+CompressionResult = collections.namedtuple(
+    'CompressionResult',
+    ['src', 'dst', 'amount', 'total_before', 'total_after', 'edges_before',
+     'edges_after', 'max_net_error', 'build_time', 'solve_time'],
+)
+CompressionResult.__doc__ = """
+The compressed debts, src[k] owing dst[k] amount[k] > 0, and statistics.
+"""
+
+
+def net_positions(src, dst, amount, n):
+    """
+    Net position of every party: what it is owed less what it owes.
+    """
+    amount = np.asarray(amount, dtype=float)
+    return (np.bincount(dst, weights=amount, minlength=n)
+            - np.bincount(src, weights=amount, minlength=n))
+
+
+def check_solution(src, dst, amount, new_src, new_dst, new_amount, n,
+                   tol=1.0e-6):
+    """
+    Whether the new debts leave every net position within tol of the old.
+    """
+    diff = (net_positions(new_src, new_dst, new_amount, n)
+            - net_positions(src, dst, amount, n))
+    return bool(np.all(np.abs(diff) <= tol))
+
+
+def pair_debts(src, dst, amount):
+    """
+    Merge the debts into one signed amount per unordered pair (i < j).
+
+    Returns (i, j, y) with y > 0 when i owes j.  Debts of a party to itself
+    are dropped.
+    """
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    amount = np.asarray(amount, dtype=float)
+    keep = src != dst
+    src, dst, amount = src[keep], dst[keep], amount[keep]
+    i = np.minimum(src, dst)
+    j = np.maximum(src, dst)
+    y = np.where(src == i, amount, -amount)
+    n = int(j.max()) + 1 if j.size else 1
+    keys, inverse = np.unique(i * n + j, return_inverse=True)
+    return keys // n, keys % n, np.bincount(inverse.ravel(), weights=y)
+
+
+def incidence(i, j, n):
+    """
+    The n x E matrix B with B y the net positions of the pair debts y.
+
+    One row per connected component is dropped, as the rows of a component
+    sum to zero.
+    """
+    e = np.arange(i.size)
+    B = sparse.csr_matrix(
+        (np.r_[np.ones(e.size), -np.ones(e.size)], (np.r_[j, i], np.r_[e, e])),
+        shape=(n, i.size),
+    )
+    _, labels = csgraph.connected_components(
+        sparse.csr_matrix((np.ones(e.size), (i, j)), shape=(n, n)),
+        directed=False,
+    )
+    _, first = np.unique(labels, return_index=True)
+    rows = np.setdiff1d(np.arange(n), first)
+    return B[rows], rows
+
+
+def _solve(handle, norm):
+    from naginterfaces.base import utils
+    from naginterfaces.library import opt
+    iom = utils.FileObjManager(locus_in_output=False)
+    # A solver warning is issued with warnings.warn and the results are
+    # still returned
+    try:
+        if norm == 1:
+            ret = opt.handle_solve_lp_ipm(handle, io_manager=iom)
+        else:
+            ret = opt.handle_solve_socp_ipm(handle, io_manager=iom)
+    finally:
+        opt.handle_free(handle)
+    return np.asarray(ret.x, dtype=float)
+
+
+def compress(src, dst, amount, n, norm=1, conservative=False, tol=1.0e-6,
+             options=()):
+    """
+    Compress the debts src[k] -> dst[k] of amount[k] between n parties.
+
+    Only pairs that already have a debt may carry one afterwards.  With
+    conservative, a pair's debt may shrink but not grow or change
+    direction.  Amounts below tol are dropped from the result.  options are
+    passed to handle_opt_set.
+    """
+    from naginterfaces.library import opt
+    t0 = time.perf_counter()
+    i, j, y = pair_debts(src, dst, amount)
+    B, rows = incidence(i, j, n)
+    net = net_positions(src, dst, amount, n)[rows]
+    npair = y.size
+    options = ('Print Level = 0', 'Print Options = No') + tuple(options)
+
+    if norm == 1:
+        # y = yp - ym with yp, ym >= 0; minimize sum(yp + ym)
+        if conservative:
+            bu = np.r_[np.maximum(y, 0.0), np.maximum(-y, 0.0)]
+        else:
+            bu = None
+        handle = build_lp(
+            sparse.hstack([B, -B], format='csr'), net, net,
+            c=np.ones(2 * npair), bl=0.0, bu=bu, options=options,
+        )
+    elif norm == 2:
+        if conservative:
+            bl, bu = np.minimum(y, 0.0), np.maximum(y, 0.0)
+        else:
+            bl, bu = -np.inf, np.inf
+        handle = build_lp(B, net, net, bl=bl, bu=bu, options=options)
+        diag = np.arange(1, npair + 1)
+        opt.handle_set_quadobj(
+            handle, idxc=[], c=[], irowh=diag, icolh=diag, h=np.ones(npair),
+        )
+    else:
+        raise ValueError('norm must be 1 or 2')
+    build_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    x = _solve(handle, norm)
+    solve_time = time.perf_counter() - t0
+    new_y = x[:npair] - x[npair:] if norm == 1 else x
+
+    keep = np.abs(new_y) > tol
+    new_i, new_j, new_y = i[keep], j[keep], new_y[keep]
+    new_src = np.where(new_y > 0, new_i, new_j)
+    new_dst = np.where(new_y > 0, new_j, new_i)
+    new_amount = np.abs(new_y)
+    error = np.max(np.abs(
+        net_positions(new_src, new_dst, new_amount, n)
+        - net_positions(src, dst, amount, n)), initial=0.0)
+    return CompressionResult(
+        new_src, new_dst, new_amount, float(np.sum(np.asarray(amount))),
+        float(new_amount.sum()), int(np.size(amount)), int(new_amount.size),
+        float(error), build_time, solve_time,
+    )
+
+
+def random_debts(n, degree, seed=1):
+    """
+    A random debt graph: about degree debts owed by each of n parties.
+    """
+    rng = np.random.RandomState(seed)
+    m = n * degree
+    src = rng.randint(0, n, m)
+    dst = (src + rng.randint(1, n, m)) % n
+    return src, dst, rng.lognormal(3.0, 1.0, m)
+
+
+def bench_compress(sizes=(10**2, 10**3, 10**4, 10**5), degrees=(2, 8),
+                   norm=1):
+    """
+    Compress random graphs; return (n, degree, result) tuples.
+    """
+    rows = []
+    for n in sizes:
+        for degree in degrees:
+            src, dst, amount = random_debts(n, degree)
+            rows.append((n, degree, compress(src, dst, amount, n, norm)))
+    return rows
+
+
+def main():
+    """
+    Print the benchmark for both norms.
+    """
+    for norm in (1, 2):
+        print('norm = {}'.format(norm))
+        print('{:>8s} {:>6s} {:>9s} {:>9s} {:>8s} {:>8s} {:>10s}'.format(
+            'parties', 'degree', 'edges', 'after', 'build s', 'solve s',
+            'net error'))
+        for n, degree, res in bench_compress(norm=norm):
+            print('{:8d} {:6d} {:9d} {:9d} {:8.3f} {:8.3f} {:10.2e}'.format(
+                n, degree, res.edges_before, res.edges_after,
+                res.build_time, res.solve_time, res.max_net_error))
+
+
+if __name__ == '__main__':
+    main()
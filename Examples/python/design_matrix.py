@@ -0,0 +1,107 @@
+"""
+Fortran-ordered design matrices from DataFrames and .npy files.
+
+quantile_linreg_pandas.ipynb builds its design matrix with a list
+comprehension, [[1., incomei] for incomei in df['income']], which creates
+a Python list per row.  design_matrix() allocates the Fortran-ordered
+result once and fills it column by column (DataFrames, dicts of arrays) or
+in row blocks (2-D arrays such as memory-mapped .npy files), with no
+Python-level iteration over the rows.
+
+correg.quantile_linreg_easy expects the intercept column in x, so use
+intercept=True for it; correg.quantile_linreg and correg.linregm_fit add the
+intercept themselves, so use intercept=False.
+
+Example:
+
+    df = pd.read_csv('engel.csv')
+    x = design_matrix(df, ['income'])
+    regn = correg.quantile_linreg_easy(x, response(df, 'expenditure'), tau)
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import numpy as np
+
+
+def _is_dataframe_like(source):
+    return hasattr(source, 'columns') and hasattr(source, '__getitem__')
+
+
+def design_matrix(source, columns=None, intercept=True, out=None,
+                  dtype=np.float64, block_rows=1 << 16):
+    """
+    Return the chosen columns of source as a Fortran-ordered matrix.
+
+    source is a DataFrame or dict of 1-D arrays (columns are names), or a
+    2-D array (columns are indices, all of them by default).  With
+    intercept a column of ones comes first.  out, if given, must be a
+    Fortran-ordered array of the right shape and is filled instead of
+    allocating a new one.
+    """
+    if isinstance(source, dict) or _is_dataframe_like(source):
+        if columns is None:
+            columns = list(source.columns if _is_dataframe_like(source)
+                           else source.keys())
+        data = [source[c] for c in columns]
+        n = len(data[0]) if data else 0
+        array_source = None
+    else:
+        array_source = source if isinstance(source, np.ndarray) \
+            else np.asarray(source)
+        if array_source.ndim != 2:
+            raise ValueError('source must be a 2-D array')
+        if columns is None:
+            columns = list(range(array_source.shape[1]))
+        n = array_source.shape[0]
+
+    off = 1 if intercept else 0
+    shape = (n, len(columns) + off)
+    if out is None:
+        out = np.empty(shape, dtype=dtype, order='F')
+    elif out.shape != shape or not out.flags.f_contiguous:
+        raise ValueError(
+            'out must be a Fortran-ordered array of shape {}'.format(shape))
+    if intercept:
+        out[:, 0] = 1.0
+
+    if array_source is None:
+        for k, col in enumerate(data):
+            out[:, k + off] = getattr(col, 'to_numpy', lambda: col)()
+    else:
+        cols = np.asarray(columns)
+        contiguous = cols.size and np.array_equal(
+            cols, np.arange(cols[0], cols[0] + cols.size))
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            if contiguous:
+                block = array_source[start:stop, cols[0]:cols[0] + cols.size]
+            else:
+                block = array_source[start:stop][:, cols]
+            out[start:stop, off:] = block
+    return out
+
+
+def design_matrix_npy(path, columns=None, intercept=True, out=None,
+                      dtype=np.float64, block_rows=1 << 16):
+    """
+    design_matrix() for a 2-D .npy file, read through a memory map.
+    """
+    return design_matrix(
+        np.load(path, mmap_mode='r'), columns, intercept, out, dtype,
+        block_rows,
+    )
+
+
+def response(source, column=None):
+    """
+    Return one column of source as a contiguous float64 vector.
+
+    column is a name for DataFrames and dicts, an index for 2-D arrays,
+    and may be omitted for 1-D arrays and Series.
+    """
+    if column is not None:
+        if isinstance(source, dict) or _is_dataframe_like(source):
+            source = source[column]
+        else:
+            source = np.asarray(source)[:, column]
+    source = getattr(source, 'to_numpy', lambda: source)()
+    return np.ascontiguousarray(source, dtype=np.float64)
@@ -0,0 +1,168 @@
+"""
+Memoized objective callbacks for the derivative-free solvers.
+
+opt.handle_solve_dfls, and opt.handle_solve_bounds_foas with 'FOAS Estimate
+Derivatives = Yes', often evaluate the objective again at points they have
+already visited.  EvalCache wraps an objfun callback and returns the stored
+result whenever it is called with exactly the same x (compared byte for
+byte) as before.  The cache keeps the most recently used results within a
+byte budget, counts hits and the evaluation time they saved, and can also
+keep every result in a shelve file so that a restarted solve does not
+repeat evaluations made by an earlier run.
+
+Example, with the problem of handle_solve_dfls_ex.py:
+
+    with EvalCache(objfun, path='kowalik.db') as cached:
+        ret = opt.handle_solve_dfls(handle, cached, x, nres)
+        cached.stats()
+"""
+# pylint: disable=invalid-name,too-many-instance-attributes
+import collections
+import shelve
+import time
+
+import numpy as np
+
+
+def _copy(value):
+    """
+    A copy of a callback result that later changes to it cannot reach.
+    """
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, (np.ndarray, list)):
+        return np.array(value, dtype=float)
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 8
+
+
+def _failed(value):
+    """
+    Whether a (result, inform) pair asks the solver to reject or stop.
+    """
+    return (
+        isinstance(value, tuple) and len(value) > 1
+        and isinstance(value[-1], (int, np.integer)) and value[-1] != 0
+    )
+
+
+class EvalCache:
+    """
+    An LRU cache of objfun results keyed by the bytes of x.
+
+    fun is called as fun(x, *args) on a miss, so the wrapper can stand in
+    for dfls objfun(x, nres), foas objfun(x, inform) and bxnl
+    lsqfun(x, nres, inform, data); the extra arguments are not part of the
+    key.  Results whose trailing inform is nonzero are never cached.  With
+    path, results are also stored in (and looked up from) a shelve file,
+    which close() writes out.
+    """
+    def __init__(self, fun, max_bytes=64 * 2**20, path=None):
+        self.fun = fun
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.eval_time = 0.0
+        self.time_saved = 0.0
+        self._entries = collections.OrderedDict()
+        self._store = None if path is None else shelve.open(path)
+
+    @staticmethod
+    def key(x):
+        """
+        The cache key of x: the bytes of its float64 values.
+        """
+        return np.ascontiguousarray(x, dtype=np.float64).tobytes()
+
+    def __call__(self, x, *args):
+        key = self.key(x)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.time_saved += entry[1]
+            return _copy(entry[0])
+
+        if self._store is not None:
+            entry = self._store.get(key.hex())
+            if entry is not None:
+                self.disk_hits += 1
+                self.time_saved += entry[1]
+                self._insert(key, entry)
+                return _copy(entry[0])
+
+        self.misses += 1
+        t0 = time.perf_counter()
+        value = self.fun(x, *args)
+        seconds = time.perf_counter() - t0
+        self.eval_time += seconds
+        if not _failed(value):
+            entry = (_copy(value), seconds)
+            self._insert(key, entry)
+            if self._store is not None:
+                self._store[key.hex()] = entry
+        return value
+
+    def _insert(self, key, entry):
+        size = len(key) + _nbytes(entry[0])
+        if size > self.max_bytes:
+            return
+        while self._entries and self.nbytes + size > self.max_bytes:
+            old_key, (old_value, _) = self._entries.popitem(last=False)
+            self.nbytes -= len(old_key) + _nbytes(old_value)
+            self.evictions += 1
+        self._entries[key] = entry
+        self.nbytes += size
+
+    def clear(self):
+        """
+        Drop the cached results held in memory; the counters are kept.
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def close(self):
+        """
+        Write out and close the shelve file, if any.
+        """
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Return the cache counters as a dict.
+        """
+        calls = self.hits + self.disk_hits + self.misses
+        return {
+            'calls': calls,
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / calls if calls else 0.0,
+            'eval_time': self.eval_time,
+            'time_saved': self.time_saved,
+        }
@@ -0,0 +1,182 @@
+"""
+Parallel finite-difference gradients for opt.handle_solve_bounds_foas.
+
+opt-noise-dfo-a.ipynb passes an empty objgrd and sets 'FOAS Estimate
+Derivatives = Yes', so the solver evaluates the perturbed points one after
+another.  FDGradient wraps a scalar objfun(x, inform) and is itself an
+objgrd(x, fdx, inform): on every call it evaluates all the forward or
+central perturbations at once on a thread or process pool and writes the
+differences into fdx.  The steps follow the usual error balance between
+truncation and noise, h = sqrt(noise) * max(|x|, 1) for forward and
+noise**(1/3) * max(|x|, 1) for central differences, where noise is the
+relative noise level of the objective (machine precision for a smooth
+one).  Steps that would leave the bounds are taken on the other side.  The
+number of evaluations and the time spent in them are counted.
+
+Use a process pool for CPU-bound objectives written in Python; objfun must
+then be picklable.  Do not set 'FOAS Estimate Derivatives' when passing
+an FDGradient as objgrd.
+
+Example, with objfun of opt-noise-dfo-a.ipynb and var = 1.0e-8:
+
+    grad = FDGradient(objfun, noise=1.0e-4, bl=bl, bu=bu)
+    ret = opt.handle_solve_bounds_foas(handle, x, objfun=objfun,
+                                       objgrd=grad, io_manager=iom)
+    grad.stats()
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-instance-attributes
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+METHODS = ('forward', 'central')
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(objfun, args):
+    _worker['objfun'] = objfun
+    _worker['args'] = args
+
+
+def _timed_eval(objfun, args, x):
+    t0 = time.perf_counter()
+    f = objfun(x, 0, *args)[0]
+    return float(f), time.perf_counter() - t0
+
+
+def _worker_eval(x):
+    return _timed_eval(_worker['objfun'], _worker['args'], x)
+
+
+def fd_steps(x, method='forward', noise=None):
+    """
+    Noise-balanced finite-difference steps for every element of x.
+    """
+    eps = np.finfo(float).eps if noise is None else max(noise, 1.0e-16)
+    power = 0.5 if method == 'forward' else 1.0 / 3.0
+    return eps ** power * np.maximum(np.abs(x), 1.0)
+
+
+class FDGradient:
+    """
+    objgrd for handle_solve_bounds_foas by parallel finite differences.
+
+    pool is 'thread' or 'process'; data, if given, is passed to objfun as
+    its last argument.  Call close(), or use a with block, to shut the pool
+    down.
+    """
+    def __init__(self, objfun, method='forward', noise=None, bl=None,
+                 bu=None, pool='thread', workers=None, data=None):
+        if method not in METHODS:
+            raise ValueError('method must be one of {}'.format(METHODS))
+        self.objfun = objfun
+        self.method = method
+        self.noise = noise
+        self.bl = None if bl is None else np.asarray(bl, dtype=float)
+        self.bu = None if bu is None else np.asarray(bu, dtype=float)
+        self.args = () if data is None else (data,)
+        if pool == 'thread':
+            self._pool = ThreadPoolExecutor(workers)
+            self._eval = lambda x: _timed_eval(objfun, self.args, x)
+        elif pool == 'process':
+            self._pool = ProcessPoolExecutor(
+                workers, initializer=_init_worker,
+                initargs=(objfun, self.args),
+            )
+            self._eval = _worker_eval
+        else:
+            raise ValueError("pool must be 'thread' or 'process'")
+        self.ncalls = 0
+        self.nevals = 0
+        self.eval_time = 0.0
+        self.wall_time = 0.0
+
+    def points(self, x):
+        """
+        Return (lower, upper): the points differenced for every variable.
+
+        An entry equal to x means that side is the base point.  One-sided
+        differences at a bound use the forward step.
+        """
+        h = fd_steps(x, self.method, self.noise)
+        h1 = fd_steps(x, 'forward', self.noise)
+        lower = x - h if self.method == 'central' else x.copy()
+        upper = x + h
+        if self.bu is not None:
+            over = upper > self.bu
+            upper[over] = x[over]
+            lower[over] = x[over] - h1[over]
+        if self.bl is not None:
+            under = lower < self.bl
+            lower[under] = x[under]
+            upper[under] = x[under] + h1[under]
+        return lower, upper
+
+    def gradient(self, x):
+        """
+        The finite-difference gradient at x.
+        """
+        t0 = time.perf_counter()
+        x = np.array(x, dtype=float)
+        n = x.size
+        lower, upper = self.points(x)
+        up = np.flatnonzero(upper != x)
+        lo = np.flatnonzero(lower != x)
+        pts = np.tile(x, (up.size + lo.size + 1, 1))
+        pts[np.arange(up.size), up] = upper[up]
+        pts[up.size + np.arange(lo.size), lo] = lower[lo]
+        # The base point is only needed for one-sided differences
+        if up.size == n and lo.size == n:
+            pts = pts[:-1]
+
+        results = list(self._pool.map(self._eval, pts))
+        values = np.array([f for f, _ in results])
+        f_base = values[-1] if len(pts) > up.size + lo.size else np.nan
+        f_up = np.full(n, f_base)
+        f_lo = np.full(n, f_base)
+        f_up[up] = values[:up.size]
+        f_lo[lo] = values[up.size:up.size + lo.size]
+
+        self.ncalls += 1
+        self.nevals += len(pts)
+        self.eval_time += sum(s for _, s in results)
+        self.wall_time += time.perf_counter() - t0
+        return (f_up - f_lo) / (upper - lower)
+
+    def __call__(self, x, fdx, inform, _data=None):
+        fdx[:] = self.gradient(x)
+        return inform
+
+    def stats(self):
+        """
+        Return the evaluation counters as a dict.
+
+        eval_time is the time spent inside objfun summed over the workers,
+        wall_time the elapsed time of the gradient calls; their ratio is the
+        parallel speed-up.
+        """
+        return {
+            'calls': self.ncalls,
+            'evaluations': self.nevals,
+            'evaluations_per_call': (self.nevals / self.ncalls
+                                     if self.ncalls else 0.0),
+            'eval_time': self.eval_time,
+            'wall_time': self.wall_time,
+            'speedup': (self.eval_time / self.wall_time
+                        if self.wall_time else 0.0),
+        }
+
+    def close(self):
+        """
+        Shut down the pool.
+        """
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
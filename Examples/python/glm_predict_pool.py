@@ -0,0 +1,144 @@
+"""
+Parallel chunked prediction with correg.glm_predict.
+
+Scoring a whole test matrix with one glm_predict call needs all of it in
+memory and runs on one core.  predict_blocks() splits the rows into blocks
+and scores them on a process pool.  The fitted model (bhat, cov_bhat) is
+placed in shared memory once, the input is read either from shared memory
+or from a memory-mapped .npy file, and every worker writes its yhat and
+se_yhat rows straight into the output arrays, which may themselves be
+memory-mapped .npy files.  The throughput in rows per second is reported to
+help size the pool.
+
+Example, with the model of reg-a.ipynb:
+
+    res = predict_blocks('N', 'x_test.npy', isx, fit_glm.b, fit_glm.cov,
+                         True, link='I', s=fit_glm.s, out='scores')
+    res.rows_per_second
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from shared_arrays import SharedArray, attach
+
+PredictResult = collections.namedtuple(
+    'PredictResult',
+    ['yhat', 'se_yhat', 'nrows', 'elapsed', 'rows_per_second'],
+)
+
+# Per-row keyword arguments of glm_predict, sliced along with x
+ROW_ARGS = ('off', 'wt', 't')
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _open(source, mode='r'):
+    """
+    Return the array described by a shared memory spec or a .npy path.
+    """
+    if isinstance(source, str):
+        return np.load(source, mmap_mode=mode)
+    return attach(source)
+
+
+def _init_worker(x_src, out_srcs, model_specs, row_srcs, args, kwargs):
+    from naginterfaces.library import correg
+    _worker['predict'] = correg.glm_predict
+    _worker['x'] = _open(x_src)
+    _worker['out'] = [_open(src, 'r+') for src in out_srcs]
+    _worker['bhat'], _worker['cov_bhat'] = [attach(s) for s in model_specs]
+    _worker['rows'] = {k: _open(src) for k, src in row_srcs.items()}
+    _worker['args'] = args
+    _worker['kwargs'] = kwargs
+
+
+def _predict_block(start, stop):
+    w = _worker
+    errfn, isx, vfobs = w['args']
+    kwargs = dict(w['kwargs'])
+    for k, a in w['rows'].items():
+        kwargs[k] = np.ascontiguousarray(a[start:stop])
+    x = np.asfortranarray(w['x'][start:stop])
+    _, _, yhat, se_yhat = w['predict'](
+        errfn, x, isx, w['bhat'], w['cov_bhat'], vfobs, **kwargs
+    )
+    w['out'][0][start:stop] = yhat
+    w['out'][1][start:stop] = se_yhat
+    return stop - start
+
+
+def predict_blocks(errfn, x, isx, bhat, cov_bhat, vfobs, block_rows=100000,
+                   processes=None, out=None, **kwargs):
+    """
+    Score the rows of x with glm_predict on a pool of processes.
+
+    x is an array or the path of a .npy file, which is memory-mapped.  The
+    remaining glm_predict arguments are passed through unchanged, except
+    the per-row arrays named in ROW_ARGS, which are split with x.  With
+    out=None the predictions are returned as arrays; otherwise they are
+    written to the .npy files out + '_yhat.npy' and out + '_se.npy' and the
+    result holds memory maps of them.
+    """
+    owned = []
+    try:
+        if isinstance(x, str):
+            x_src = os.path.abspath(x)
+            nrows = np.load(x_src, mmap_mode='r').shape[0]
+        else:
+            shared_x = SharedArray.copy_of(x)
+            owned.append(shared_x)
+            x_src = shared_x.spec
+            nrows = shared_x.array.shape[0]
+
+        if out is None:
+            outputs = [SharedArray((nrows,)), SharedArray((nrows,))]
+            owned += outputs
+            out_srcs = [o.spec for o in outputs]
+        else:
+            out_srcs = [os.path.abspath(out + suffix)
+                        for suffix in ('_yhat.npy', '_se.npy')]
+            for path in out_srcs:
+                np.lib.format.open_memmap(
+                    path, mode='w+', dtype=np.float64, shape=(nrows,),
+                ).flush()
+
+        model = [SharedArray.copy_of(bhat), SharedArray.copy_of(cov_bhat)]
+        owned += model
+        row_srcs = {}
+        for k in ROW_ARGS:
+            if kwargs.get(k) is not None:
+                shared = SharedArray.copy_of(kwargs.pop(k))
+                owned.append(shared)
+                row_srcs[k] = shared.spec
+
+        blocks = [(start, min(start + block_rows, nrows))
+                  for start in range(0, nrows, block_rows)]
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker,
+                initargs=(x_src, out_srcs, [m.spec for m in model], row_srcs,
+                          (errfn, isx, vfobs), kwargs),
+        ) as pool:
+            done = sum(f.result() for f in [
+                pool.submit(_predict_block, start, stop)
+                for start, stop in blocks
+            ])
+        elapsed = time.perf_counter() - t0
+
+        if out is None:
+            yhat, se_yhat = [o.array.copy() for o in outputs]
+        else:
+            yhat, se_yhat = [np.load(path, mmap_mode='r') for path in out_srcs]
+    finally:
+        for shared in owned:
+            shared.close()
+
+    return PredictResult(
+        yhat, se_yhat, done, elapsed, done / elapsed if elapsed > 0 else 0.0,
+    )
@@ -0,0 +1,230 @@
+"""
+Multistart over the handle-based solvers on a pool of processes.
+
+glopt.nlp_multistart_sqp (SQP_multistart.ipynb) runs its starting points
+one after the other.  multistart() solves the same bound-constrained
+problem from many starting points with opt.handle_solve_bounds_foas or
+opt.handle_solve_bxnl on every core.  Each worker builds its own handle
+once (handle_init, handle_set_simplebounds and handle_set_nlnobj or
+handle_set_nlnls) and takes starting points from a shared queue until it is
+empty.  The best objective value found so far is shared between the
+workers, and a solve whose objective is still far above it after
+min_iters iterations is stopped from monit by raising
+utils.UserCallbackTerminate.  The solvers report that, and any other
+warning, with warnings.warn rather than an exception, so monit records the
+stop itself and the warnings of every solve are captured.  The local
+minima found are returned with duplicates merged.
+
+The callbacks must be picklable, i.e. defined at module level.
+
+Example, with the callbacks of handle_solve_bounds_foas_ex.py:
+
+    starts = np.random.uniform(bl, bu, (64, 2))
+    res = multistart('foas', objfun, objgrd, bl, bu, starts)
+    res.minima[0], res.values[0], res.counts
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SOLVERS = ('foas', 'bxnl')
+
+MultistartResult = collections.namedtuple(
+    'MultistartResult',
+    ['x', 'f', 'status', 'niter', 'minima', 'values', 'counts'],
+)
+MultistartResult.__doc__ = """
+Results of a multistart run.
+
+x, f, status, niter -- the solution, objective value, outcome ('optimal',
+                       'warning', 'stopped' or 'error') and number of
+                       monitored iterations of every start, in order
+minima, values      -- the distinct local minima, best first
+counts              -- how many starts ended at each minimum
+"""
+
+Problem = collections.namedtuple(
+    'Problem', ['solver', 'fun', 'grd', 'bl', 'bu', 'nres', 'options', 'data'],
+)
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(queue, best, problem, stop_gap, min_iters):
+    _worker['queue'] = queue
+    _worker['best'] = best
+    _worker['problem'] = problem
+    _worker['rule'] = (stop_gap, min_iters)
+
+
+def _make_handle(problem):
+    from naginterfaces.library import opt
+    n = len(problem.bl)
+    handle = opt.handle_init(n)
+    opt.handle_set_simplebounds(handle, bl=problem.bl, bu=problem.bu)
+    if problem.solver == 'foas':
+        opt.handle_set_nlnobj(handle, idxfd=list(range(1, n + 1)))
+    else:
+        opt.handle_set_nlnls(handle, problem.nres)
+    for option in (
+            'Print Level = 0',
+            'Print Options = No',
+            'Print Solution = No',
+            problem.solver.upper() + ' Monitor Frequency = 1',
+    ) + tuple(problem.options):
+        opt.handle_opt_set(handle, option)
+    return handle
+
+
+def _solve(handle, x0):
+    """
+    Solve from x0; return (x, f, status, niter).
+    """
+    from naginterfaces.base import utils
+    from naginterfaces.library import opt
+    problem = _worker['problem']
+    best = _worker['best']
+    stop_gap, min_iters = _worker['rule']
+    niter = [0]
+    stopped = [False]
+
+    def monit(_x, rinfo, _stats, _data=None):
+        niter[0] += 1
+        if stop_gap is None or niter[0] < min_iters:
+            return
+        f_best = best.value
+        if rinfo[0] > f_best + stop_gap * (abs(f_best) + 1.0):
+            stopped[0] = True
+            raise utils.UserCallbackTerminate
+
+    iom = utils.FileObjManager(locus_in_output=False)
+    kwargs = {'monit': monit, 'io_manager': iom}
+    if problem.data is not None:
+        kwargs['data'] = problem.data
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', utils.NagAlgorithmicWarning)
+        try:
+            if problem.solver == 'foas':
+                ret = opt.handle_solve_bounds_foas(
+                    handle, x0, objfun=problem.fun, objgrd=problem.grd,
+                    **kwargs)
+            else:
+                ret = opt.handle_solve_bxnl(
+                    handle, problem.fun, problem.grd, x0, problem.nres,
+                    **kwargs)
+        except utils.NagException:
+            return np.full(len(x0), np.nan), np.nan, 'error', niter[0]
+    if stopped[0]:
+        status = 'stopped'
+    elif any(issubclass(w.category, utils.NagAlgorithmicWarning)
+             for w in caught):
+        status = 'warning'
+    else:
+        status = 'optimal'
+
+    f = float(ret.rinfo[0])
+    if status != 'stopped':
+        with best.get_lock():
+            if f < best.value:
+                best.value = f
+    return np.array(ret.x, dtype=float), f, status, niter[0]
+
+
+def _drain():
+    """
+    Solve starting points from the queue until a None arrives.
+    """
+    handle = _make_handle(_worker['problem'])
+    results = []
+    try:
+        for item in iter(_worker['queue'].get, None):
+            index, x0 = item
+            results.append((index,) + _solve(handle, x0))
+    finally:
+        from naginterfaces.library import opt
+        opt.handle_free(handle)
+    return results
+
+
+def distinct_minima(x, f, xtol=1e-4):
+    """
+    Merge points within xtol (relative, max norm) of a better one.
+
+    Returns (minima, values, counts) sorted by objective value; NaN rows
+    are ignored.
+    """
+    keep = np.flatnonzero(~np.isnan(f))
+    minima, values, counts = [], [], []
+    for i in keep[np.argsort(f[keep], kind='stable')]:
+        for k, xk in enumerate(minima):
+            if np.max(np.abs(x[i] - xk)) <= xtol * (1.0 + np.max(np.abs(xk))):
+                counts[k] += 1
+                break
+        else:
+            minima.append(x[i])
+            values.append(f[i])
+            counts.append(1)
+    n = x.shape[1]
+    return (np.array(minima).reshape(-1, n), np.array(values),
+            np.array(counts, dtype=int))
+
+
+def multistart(solver, fun, grd, bl, bu, starts, nres=None, options=(),
+               data=None, processes=None, stop_gap=1.0, min_iters=20,
+               xtol=1e-4):
+    """
+    Solve from every row of starts on a process pool.
+
+    solver is 'foas' (fun, grd are objfun(x, inform) and
+    objgrd(x, fdx, inform)) or 'bxnl' (fun, grd are lsqfun and lsqgrd, and
+    nres is required).  options are passed to handle_opt_set.  A start is
+    stopped once it has run min_iters iterations and its objective exceeds
+    the best one found so far by more than stop_gap * (|best| + 1); use
+    stop_gap=None to run every start to completion.  Stopped starts do not
+    count as minima.
+    """
+    if solver not in SOLVERS:
+        raise ValueError('solver must be one of {}'.format(SOLVERS))
+    if solver == 'bxnl' and nres is None:
+        raise ValueError('nres is required for bxnl')
+    starts = np.atleast_2d(np.asarray(starts, dtype=float))
+    nstart, n = starts.shape
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, nstart))
+    problem = Problem(
+        solver, fun, grd, np.asarray(bl, dtype=float),
+        np.asarray(bu, dtype=float), nres, tuple(options), data,
+    )
+
+    ctx = multiprocessing.get_context()
+    queue = ctx.Queue()
+    best = ctx.Value('d', np.inf)
+    for item in enumerate(starts):
+        queue.put(item)
+    for _ in range(processes):
+        queue.put(None)
+
+    x = np.full((nstart, n), np.nan)
+    f = np.full(nstart, np.nan)
+    status = np.empty(nstart, dtype=object)
+    niter = np.zeros(nstart, dtype=int)
+    with ProcessPoolExecutor(
+            max_workers=processes, mp_context=ctx, initializer=_init_worker,
+            initargs=(queue, best, problem, stop_gap, min_iters),
+    ) as pool:
+        futures = [pool.submit(_drain) for _ in range(processes)]
+        for fut in futures:
+            for index, x_i, f_i, status_i, niter_i in fut.result():
+                x[index], f[index] = x_i, f_i
+                status[index], niter[index] = status_i, niter_i
+
+    ok = np.isin(status, ('optimal', 'warning'))
+    minima, values, counts = distinct_minima(
+        x, np.where(ok, f, np.nan), xtol)
+    return MultistartResult(x, f, status, niter, minima, values, counts)
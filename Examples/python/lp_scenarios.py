@@ -0,0 +1,232 @@
+"""
+What-if scenarios of an LP model solved in parallel.
+
+production_planning.ipynb edits one handle in place (handle_add_vars,
+handle_set_linconstr_coeff, a new handle_set_linconstr) and solves it again
+after each change.  solve_scenarios() instead takes a base model as arrays
+plus a list of changes per scenario.  The base model is sent once to every
+worker process, and each worker applies a scenario's changes to a copy of
+it, builds a new handle, solves it with handle_solve_lp_ipm and frees the
+handle.  Objective values, primal and dual solutions and the status of
+every scenario come back in preallocated arrays.
+
+Indices are 0-based here and converted to the 1-based ones of the handle
+API when the handle is built.  A scenario cannot change the number of
+variables or constraints; to switch a variable or constraint on in some
+scenarios (like the third plant of production_planning.ipynb) include it
+in the base model with zero bounds and change the bounds.
+
+Warm starts: handle_solve_lp_ipm does not use the values of x and u on
+entry, so warm_start passes each worker's previous solution only to a
+solver that is given through solver and accepts x and u.
+
+Example, for production_planning.ipynb with the third plant:
+
+    base = LPModel(
+        c=[2., 4.5, 7.], bl=[0., 0., 0.], bu=[1e20, 100., 0.],
+        irow=[0, 0, 0, 1, 1, 1, 2, 2, 2], icol=[0, 1, 2] * 3,
+        val=[1.2, 3., 5., 6., 10., 12., 40., 80., 120.],
+        cl=[-1e20] * 3, cu=[1500., 6000., 16000.], options=('Task = Max',),
+    )
+    scenarios = [{'bounds': {2: (0., cap)}} for cap in range(0, 101, 10)]
+    res = solve_scenarios(base, scenarios)
+    res.obj, res.status
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+INF_BOUND = 1.0e20
+
+LPModel = collections.namedtuple(
+    'LPModel', ['c', 'bl', 'bu', 'irow', 'icol', 'val', 'cl', 'cu', 'options'],
+)
+LPModel.__new__.__defaults__ = ((),)
+LPModel.__doc__ = """
+An LP: optimize c x subject to bl <= x <= bu and cl <= A x <= cu.
+
+A has the 0-based coordinates (irow, icol, val); options are passed to
+handle_opt_set (e.g. 'Task = Max').
+"""
+
+ScenarioResults = collections.namedtuple(
+    'ScenarioResults', ['obj', 'x', 'u', 'status', 'errno'],
+)
+ScenarioResults.__doc__ = """
+Results of every scenario, one row each.
+
+obj     -- (nscen,) objective values (NaN if no solution was returned)
+x       -- (nscen, nvar) primal solutions
+u       -- (nscen, 2 * (nvar + ncon)) Lagrange multipliers as returned in u
+status  -- (nscen,) 'optimal', 'warning' or 'error'
+errno   -- (nscen,) the NAG error number, 0 for 'optimal'
+"""
+
+# Change kinds accepted in a scenario
+CHANGES = ('c', 'bounds', 'rows', 'coeffs', 'options')
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def as_model(model):
+    """
+    Return model with its arrays converted to NumPy.
+    """
+    return LPModel(
+        np.asarray(model.c, dtype=float), np.asarray(model.bl, dtype=float),
+        np.asarray(model.bu, dtype=float), np.asarray(model.irow, dtype=int),
+        np.asarray(model.icol, dtype=int), np.asarray(model.val, dtype=float),
+        np.asarray(model.cl, dtype=float), np.asarray(model.cu, dtype=float),
+        tuple(model.options),
+    )
+
+
+def apply_changes(model, changes):
+    """
+    Return a copy of model with the changes of one scenario applied.
+
+    changes is a dict with any of the keys
+      'c'       -- {j: c_j}
+      'bounds'  -- {j: (bl_j, bu_j)}
+      'rows'    -- {i: (cl_i, cu_i)}
+      'coeffs'  -- {(i, j): a_ij}, replacing or adding entries of A
+      'options' -- extra handle_opt_set strings
+    """
+    unknown = set(changes) - set(CHANGES)
+    if unknown:
+        raise ValueError('unknown changes {}'.format(sorted(unknown)))
+    c, bl, bu, cl, cu = [a.copy() for a in (
+        model.c, model.bl, model.bu, model.cl, model.cu)]
+    irow, icol, val = model.irow, model.icol, model.val
+    for j, cj in changes.get('c', {}).items():
+        c[j] = cj
+    for j, (lo, hi) in changes.get('bounds', {}).items():
+        bl[j], bu[j] = lo, hi
+    for i, (lo, hi) in changes.get('rows', {}).items():
+        cl[i], cu[i] = lo, hi
+
+    coeffs = changes.get('coeffs')
+    if coeffs:
+        n = c.size
+        keys = irow * n + icol
+        ij = np.array(list(coeffs.keys()), dtype=int).reshape(-1, 2)
+        new = np.fromiter(coeffs.values(), dtype=float, count=len(coeffs))
+        pos = np.flatnonzero(np.isin(keys, ij[:, 0] * n + ij[:, 1]))
+        # Replace the entries that exist, append the others
+        lookup = dict(zip(keys[pos].tolist(), pos.tolist()))
+        val = val.copy()
+        extra = []
+        for (i, j), a in zip(ij.tolist(), new):
+            k = lookup.get(i * n + j)
+            if k is None:
+                extra.append((i, j, a))
+            else:
+                val[k] = a
+        if extra:
+            ei, ej, ea = np.array(extra).T
+            irow = np.concatenate([irow, ei.astype(int)])
+            icol = np.concatenate([icol, ej.astype(int)])
+            val = np.concatenate([val, ea])
+
+    options = model.options + tuple(changes.get('options', ()))
+    return LPModel(c, bl, bu, irow, icol, val, cl, cu, options)
+
+
+def build_handle(model):
+    """
+    Create a handle for model; the caller must free it.
+    """
+    from naginterfaces.library import opt
+    handle = opt.handle_init(model.c.size)
+    opt.handle_set_linobj(handle, cvec=model.c)
+    opt.handle_set_simplebounds(handle, bl=model.bl, bu=model.bu)
+    opt.handle_set_linconstr(
+        handle, bl=model.cl, bu=model.cu, irowb=model.irow + 1,
+        icolb=model.icol + 1, b=model.val,
+    )
+    for option in ('Print Level = 0', 'Print Options = No') + model.options:
+        opt.handle_opt_set(handle, option)
+    return handle
+
+
+def _init_worker(model, solver, warm_start):
+    from naginterfaces.base import utils
+    from naginterfaces.library import opt
+    _worker['model'] = model
+    _worker['solve'] = getattr(opt, solver)
+    _worker['warm'] = warm_start
+    _worker['last'] = None
+    _worker['utils'] = utils
+
+
+def _solve_chunk(chunk):
+    utils = _worker['utils']
+    rows = []
+    for changes in chunk:
+        handle = build_handle(apply_changes(_worker['model'], changes))
+        kwargs = {'io_manager': utils.FileObjManager(locus_in_output=False)}
+        if _worker['warm'] and _worker['last'] is not None:
+            kwargs['x'], kwargs['u'] = [a.copy() for a in _worker['last']]
+        status, errno = 'optimal', 0
+        # A solver warning (e.g. the iteration limit) is issued with
+        # warnings.warn and the results are still returned
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', utils.NagAlgorithmicWarning)
+            try:
+                ret = _worker['solve'](handle, **kwargs)
+            except utils.NagException as exc:
+                ret, status, errno = None, 'error', exc.errno
+            finally:
+                from naginterfaces.library import opt
+                opt.handle_free(handle)
+        nag = [w.message for w in caught
+               if issubclass(w.category, utils.NagAlgorithmicWarning)]
+        if ret is not None and nag:
+            status, errno = 'warning', nag[0].errno
+        if ret is None:
+            rows.append((np.nan, None, None, status, errno))
+            continue
+        x, u = np.asarray(ret.x, dtype=float), np.asarray(ret.u, dtype=float)
+        if status == 'optimal':
+            _worker['last'] = (x, u)
+        rows.append((float(ret.rinfo[0]), x, u, status, errno))
+    return rows
+
+
+def solve_scenarios(base, scenarios, processes=None, chunk=16,
+                    solver='handle_solve_lp_ipm', warm_start=False):
+    """
+    Solve base with each scenario's changes applied, on a process pool.
+
+    scenarios is a list of change dicts for apply_changes(); {} solves the
+    base model.  Scenarios are sent to the workers chunk at a time, and
+    results are returned in scenario order.
+    """
+    base = as_model(base)
+    nvar, ncon = base.c.size, base.cl.size
+    nscen = len(scenarios)
+    obj = np.full(nscen, np.nan)
+    x = np.full((nscen, nvar), np.nan)
+    u = np.full((nscen, 2 * (nvar + ncon)), np.nan)
+    status = np.empty(nscen, dtype=object)
+    errno = np.zeros(nscen, dtype=int)
+
+    starts = range(0, nscen, chunk)
+    with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker,
+            initargs=(base, solver, warm_start),
+    ) as pool:
+        futures = [pool.submit(_solve_chunk, scenarios[s:s + chunk])
+                   for s in starts]
+        for s, f in zip(starts, futures):
+            for k, (obj_k, x_k, u_k, status_k, errno_k) in \
+                    enumerate(f.result(), s):
+                obj[k], status[k], errno[k] = obj_k, status_k, errno_k
+                if x_k is not None:
+                    x[k] = x_k
+                    u[k, :u_k.size] = u_k[:u.shape[1]]
+    return ScenarioResults(obj, x, u, status, errno)
@@ -0,0 +1,151 @@
+"""
+Allocation-free residual and Jacobian callbacks for opt.handle_solve_bxnl.
+
+In orbit_ex.ipynb lsqfun creates a new rx array and lsqgrd evaluates
+2.0*np.ones(nres)*x[:] on every call.  With 10^6 residuals and more, these
+temporary arrays cost more than the model.  A LeastSquaresProblem owns the
+residual buffer, which is filled in place and returned to the solver on
+every call, and writes the Jacobian straight into the solver's rdx array
+viewed as an (nres, nvar) matrix.  The residuals are split into row
+chunks, and for large problems the chunks are evaluated on a thread pool;
+NumPy kernels release the GIL, so the chunks run in parallel.
+
+The model is given as two kernels that fill one chunk of rows in place:
+
+    residuals(x, rows, out)   out[:] = r(x)[rows]
+    jacobian(x, rows, out)    out[:, :] = J(x)[rows, :]
+
+where rows is a slice.  Per-residual weights are passed to the solver
+('rw' with 'Bxnl Use weights = Yes'), so the callbacks do not need any
+extra arrays for them.
+
+Example, the orbit of orbit_ex.ipynb:
+
+    def residuals(x, rows, out):
+        np.subtract(x[0]**2, tr[rows], out=out)
+
+    def jacobian(x, rows, out):
+        out.fill(2.0*x[0])
+
+    prob = LeastSquaresProblem(residuals, jacobian, 1, tr.size, weights=w)
+    slv = prob.solve(np.ones(1), bl=[0.], bu=[1000.])
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-instance-attributes
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class LeastSquaresProblem:
+    """
+    lsqfun and lsqgrd for handle_solve_bxnl built from chunk kernels.
+
+    chunk is the number of rows per kernel call (all of them by default
+    when threads is 1).  threads defaults to the number of CPUs, and the
+    pool is only used when there is more than one chunk.
+    """
+    def __init__(self, residuals, jacobian, nvar, nres, weights=None,
+                 chunk=None, threads=None):
+        self.residuals = residuals
+        self.jacobian = jacobian
+        self.nvar = nvar
+        self.nres = nres
+        self.weights = None if weights is None \
+            else np.ascontiguousarray(weights, dtype=float)
+        if threads is None:
+            threads = os.cpu_count() or 1
+        if chunk is None:
+            chunk = -(-nres // threads)
+        self.rows = [slice(start, min(start + chunk, nres))
+                     for start in range(0, nres, chunk)]
+        self.rx = np.empty(nres)
+        self.rdx = None
+        self._pool = ThreadPoolExecutor(threads) \
+            if threads > 1 and len(self.rows) > 1 else None
+        self.nfun = 0
+        self.ngrd = 0
+
+    def _run(self, kernel, x, out):
+        if self._pool is None:
+            for rows in self.rows:
+                kernel(x, rows, out[rows])
+        else:
+            for f in [self._pool.submit(kernel, x, rows, out[rows])
+                      for rows in self.rows]:
+                f.result()
+
+    def lsqfun(self, x, _nres, inform, _data=None):
+        """
+        Residuals at x, written into the owned buffer rx.
+        """
+        self.nfun += 1
+        self._run(self.residuals, x, self.rx)
+        return self.rx, inform
+
+    def lsqgrd(self, x, _nres, rdx, inform, _data=None):
+        """
+        The Jacobian at x, written in place into rdx (row-major).
+        """
+        self.ngrd += 1
+        if isinstance(rdx, np.ndarray) and rdx.dtype == np.float64 \
+                and rdx.flags.c_contiguous:
+            self._run(self.jacobian, x, rdx.reshape(self.nres, self.nvar))
+        else:
+            if self.rdx is None:
+                self.rdx = np.empty((self.nres, self.nvar))
+            self._run(self.jacobian, x, self.rdx)
+            rdx[:] = self.rdx.ravel()
+        return inform
+
+    def setup(self, handle):
+        """
+        Declare the dense residuals (and weights, if any) on handle.
+        """
+        from naginterfaces.library import opt
+        opt.handle_set_nlnls(handle, self.nres)
+        if self.weights is not None:
+            opt.handle_set_get_real(handle, 'rw', rarr=self.weights)
+            opt.handle_opt_set(handle, 'Bxnl Use weights = Yes')
+
+    def solve(self, x, bl=None, bu=None, options=(), monit=None,
+              io_manager=None):
+        """
+        Build a handle, solve from x with handle_solve_bxnl and free it.
+        """
+        from naginterfaces.base import utils
+        from naginterfaces.library import opt
+        handle = opt.handle_init(self.nvar)
+        try:
+            self.setup(handle)
+            if bl is not None or bu is not None:
+                opt.handle_set_simplebounds(
+                    handle,
+                    bl=np.full(self.nvar, -1.0e20) if bl is None else bl,
+                    bu=np.full(self.nvar, 1.0e20) if bu is None else bu,
+                )
+            for option in options:
+                opt.handle_opt_set(handle, option)
+            if io_manager is None:
+                io_manager = utils.FileObjManager(locus_in_output=False)
+            return opt.handle_solve_bxnl(
+                handle, self.lsqfun, self.lsqgrd,
+                np.array(x, dtype=float), self.nres, monit=monit,
+                io_manager=io_manager,
+            )
+        finally:
+            opt.handle_free(handle)
+
+    def close(self):
+        """
+        Shut down the thread pool.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,164 @@
+"""
+Memory-layout planning for arrays passed to NAG routines.
+
+Slicing such as x[:, :2] gives a non-contiguous array, and the NAG wrappers
+then copy it into the order the engine needs on every call (see
+memory_contiguity.ipynb).  A LayoutPlanner sits in front of those calls: it
+checks the strides and dtype of each array argument, converts it at most
+once, reuses the converted buffer on later calls with the same array, and
+counts the bytes it copied for every call site so that copies can be found
+and removed from hot paths.
+
+Example:
+
+    planner = LayoutPlanner()
+    prin_comp = planner.wrap('mv.prin_comp')
+    e = prin_comp(matrix, std, x[:, :2], isx, s, nvar).e
+    planner.report()
+
+Converted buffers are cached on the identity of the source array (its data
+pointer, shape, strides and dtype), so modify a source in place only after
+calling invalidate() on it.
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import collections
+import importlib
+
+import numpy as np
+
+# The array arguments of the wrapped routines: name -> position
+ROUTINE_ARRAYS = {
+    'mv.prin_comp': {'x': 2},
+    'lapacklin.dgesv': {'a': 0, 'b': 1},
+    'correg.linregm_fit': {'x': 0, 'y': 2},
+    'correg.quantile_linreg': {'dat': 1, 'y': 3},
+}
+
+
+class SiteStats:
+    """
+    Counters for the arrays prepared at one call site.
+    """
+    __slots__ = ('calls', 'arrays', 'conversions', 'reused', 'bytes_copied')
+
+    def __init__(self):
+        self.calls = 0
+        self.arrays = 0
+        self.conversions = 0
+        self.reused = 0
+        self.bytes_copied = 0
+
+    def as_dict(self):
+        """
+        Return the counters, plus the bytes copied per call, as a dict.
+        """
+        d = {k: getattr(self, k) for k in self.__slots__}
+        d['bytes_per_call'] = self.bytes_copied / self.calls if self.calls else 0.0
+        return d
+
+
+class LayoutPlanner:
+    """
+    Convert array arguments to contiguous arrays of one order, at most once.
+
+    order is 'F' (the default, what the NAG engine stores natively) or 'C'.
+    Up to max_cached converted buffers are kept, least recently used first
+    out.
+    """
+    def __init__(self, order='F', max_cached=32):
+        if order not in ('F', 'C'):
+            raise ValueError("order must be 'F' or 'C'")
+        self.order = order
+        self.max_cached = max_cached
+        self.sites = collections.defaultdict(SiteStats)
+        self._cache = collections.OrderedDict()
+
+    def is_ready(self, x, dtype=np.float64):
+        """
+        Whether x can be passed on without a copy.
+        """
+        if not isinstance(x, np.ndarray) or x.dtype != dtype:
+            return False
+        if self.order == 'F':
+            return x.flags.f_contiguous
+        return x.flags.c_contiguous
+
+    @staticmethod
+    def _key(x):
+        return (
+            x.__array_interface__['data'][0], x.shape, x.strides, x.dtype.str,
+        )
+
+    def prepare(self, x, site='default', dtype=np.float64):
+        """
+        Return x, or a contiguous copy of it in the planner's order.
+        """
+        stats = self.sites[site]
+        stats.arrays += 1
+        if self.is_ready(x, dtype):
+            return x
+
+        if isinstance(x, np.ndarray):
+            key = self._key(x)
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+                stats.reused += 1
+                return hit[1]
+
+        converted = np.array(x, dtype=dtype, order=self.order)
+        stats.conversions += 1
+        stats.bytes_copied += converted.nbytes
+
+        if isinstance(x, np.ndarray) and self.max_cached > 0:
+            # Keep x alive with its copy so its address cannot be reused
+            self._cache[key] = (x, converted)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return converted
+
+    def invalidate(self, x=None):
+        """
+        Forget the converted buffer of x, or of every array when x is None.
+        """
+        if x is None:
+            self._cache.clear()
+        elif isinstance(x, np.ndarray):
+            self._cache.pop(self._key(x), None)
+
+    def wrap(self, routine, site=None, fun=None):
+        """
+        Return routine with its array arguments passed through prepare().
+
+        routine is a key of ROUTINE_ARRAYS such as 'correg.linregm_fit';
+        the function itself is imported from naginterfaces.library unless
+        fun is given.  site defaults to the routine name.
+        """
+        positions = ROUTINE_ARRAYS[routine]
+        if fun is None:
+            module, name = routine.split('.')
+            fun = getattr(
+                importlib.import_module('naginterfaces.library.' + module),
+                name,
+            )
+        site = routine if site is None else site
+
+        def wrapped(*args, **kwargs):
+            args = list(args)
+            for arg, pos in positions.items():
+                if pos < len(args):
+                    args[pos] = self.prepare(args[pos], site)
+                elif arg in kwargs:
+                    kwargs[arg] = self.prepare(kwargs[arg], site)
+            self.sites[site].calls += 1
+            return fun(*args, **kwargs)
+
+        wrapped.__name__ = getattr(fun, '__name__', routine)
+        wrapped.__doc__ = getattr(fun, '__doc__', None)
+        return wrapped
+
+    def report(self):
+        """
+        Return the counters of every call site as a dict of dicts.
+        """
+        return {site: stats.as_dict() for site, stats in self.sites.items()}
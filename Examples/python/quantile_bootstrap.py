@@ -0,0 +1,166 @@
+"""
+Parallel bootstrap confidence intervals for correg.quantile_linreg.
+
+quantile_linreg_ex.py uses 'Interval Method = IID' because bootstrap
+intervals are too slow to compute serially on real data.
+bootstrap_intervals() refits the model to resampled rows on a process pool
+over one shared copy of dat and y.  Every block of replicates draws its rows
+from its own repeatable rand stream (resample_reg.block_statecomm), and the
+replicates are run in rounds: after each round the percentile intervals are
+recomputed, and resampling stops early once their bounds change by less
+than rtol.  Only successful refits count towards min_reps.
+
+Example, with the data of quantile_linreg_ex.py:
+
+    sorder, dat, y = get_data()
+    ci = bootstrap_intervals(dat, y, [0.1, 0.5, 0.9])
+    ci.lower, ci.b, ci.upper, ci.cov[:, :, 0], ci.nrep
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from quantile_grid import fit_quantiles
+from resample_reg import block_statecomm, resample_rows
+from shared_arrays import SharedArray, attach
+
+BootstrapCI = collections.namedtuple(
+    'BootstrapCI',
+    ['tau', 'b', 'lower', 'upper', 'cov', 'nrep', 'converged', 'samples'],
+)
+BootstrapCI.__doc__ = """
+Bootstrap results for each quantile.
+
+b             -- (p, ntau) estimates from the full data
+lower, upper  -- (p, ntau) percentile interval limits
+cov           -- (p, p, ntau) bootstrap covariance of the estimates
+nrep          -- the number of replicates used
+converged     -- whether the stopping rule ended the resampling
+samples       -- (nrep, p, ntau) replicate estimates (NaN for failed fits)
+"""
+
+# Options for the refits: only the estimates are needed
+REFIT_OPTIONS = (
+    'Interval Method = None',
+    'Matrix Returned = None',
+)
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(dat_spec, y_spec, isx, tau, options):
+    from naginterfaces.base import utils
+    _worker['dat'] = attach(dat_spec)
+    _worker['y'] = attach(y_spec)
+    _worker['args'] = (isx, tau, options)
+    _worker['error'] = utils.NagException
+
+
+def _bootstrap_block(seed, block, count, p):
+    dat, y = _worker['dat'], _worker['y']
+    isx, tau, options = _worker['args']
+    n = y.shape[0]
+    statecomm = block_statecomm(seed, block)
+
+    b = np.full((count, p, len(tau)), np.nan)
+    for r in range(count):
+        rows = resample_rows(n, statecomm)
+        try:
+            regn = fit_quantiles(
+                1, np.asfortranarray(dat[rows]), isx, y[rows], tau, options,
+            )
+        except _worker['error']:
+            continue
+        b[r] = regn.b
+    return b
+
+
+def percentile_intervals(samples, alpha=0.05):
+    """
+    Return the alpha/2 and 1 - alpha/2 percentiles of samples over axis 0.
+    """
+    lower, upper = np.nanpercentile(
+        samples, [50.0 * alpha, 100.0 - 50.0 * alpha], axis=0,
+    )
+    return lower, upper
+
+
+def bootstrap_cov(samples):
+    """
+    Return the (p, p, ntau) covariance of (nrep, p, ntau) samples.
+    """
+    _, p, ntau = samples.shape
+    cov = np.full((p, p, ntau), np.nan)
+    for t in range(ntau):
+        s = samples[:, :, t]
+        s = s[~np.isnan(s).any(axis=1)]
+        if s.shape[0] > 1:
+            cov[:, :, t] = np.cov(s, rowvar=False).reshape(p, p)
+    return cov
+
+
+def bootstrap_intervals(dat, y, tau, isx=None, alpha=0.05, seed=1,
+                        min_reps=200, max_reps=5000, round_reps=200,
+                        block=25, rtol=0.01, options=REFIT_OPTIONS,
+                        processes=None):
+    """
+    Bootstrap percentile intervals and covariances for every tau.
+
+    dat holds one observation per row (sorder = 1).  Replicates are run
+    round_reps at a time in blocks of block; after at least min_reps the
+    resampling stops as soon as no interval bound moved by more than rtol
+    times the widest interval of its quantile, or after max_reps.  Failed
+    refits do not count towards min_reps.
+    """
+    dat = np.asarray(dat, dtype=float)
+    if dat.ndim == 1:
+        dat = dat.reshape(-1, 1)
+    y = np.asarray(y, dtype=float)
+    tau = [float(t) for t in tau]
+    if isx is None:
+        isx = [1] * dat.shape[1]
+
+    b = fit_quantiles(1, np.asfortranarray(dat), isx, y, tau, options).b
+    p = b.shape[0]
+
+    parts = []
+    nrep = 0
+    nblock = 0
+    bounds = None
+    converged = False
+    with SharedArray.copy_of(dat, order='F') as sdat, \
+            SharedArray.copy_of(y) as sy, \
+            ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker,
+                initargs=(sdat.spec, sy.spec, isx, tau, tuple(options)),
+            ) as pool:
+        while nrep < max_reps:
+            todo = min(round_reps, max_reps - nrep)
+            counts = [min(block, todo - k) for k in range(0, todo, block)]
+            futures = [
+                pool.submit(_bootstrap_block, seed, nblock + i, count, p)
+                for i, count in enumerate(counts)
+            ]
+            parts += [f.result() for f in futures]
+            nblock += len(counts)
+            nrep += todo
+
+            samples = np.concatenate(parts)
+            nfit = int(np.sum(~np.isnan(samples).any(axis=(1, 2))))
+            new_bounds = np.stack(percentile_intervals(samples, alpha))
+            if bounds is not None and nfit >= min_reps:
+                width = np.nanmax(new_bounds[1] - new_bounds[0], axis=0)
+                change = np.nanmax(np.abs(new_bounds - bounds), axis=(0, 1))
+                if np.all(change <= rtol * width):
+                    converged = True
+                    bounds = new_bounds
+                    break
+            bounds = new_bounds
+
+    return BootstrapCI(
+        np.asarray(tau), b, bounds[0], bounds[1], bootstrap_cov(samples),
+        nrep, converged, samples,
+    )
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Dense quantile grids for correg.quantile_linreg on a process pool.
+
+quantile_linreg_ex.py fits three quantiles in one call.  For the full
+quantile process (99 or more values of tau) fit_tau_grid() splits the grid
+into blocks and fits them on a pool of workers that share one copy of dat
+and y.  The estimates, interval limits and covariance matrices are gathered
+into preallocated (p, ntau) and (p, p, ntau) arrays; the (n, ntau)
+residuals are only kept when asked for, and are then written by the workers
+straight into shared memory.
+
+Run this file to compare one call for the whole grid with the split fit on
+an enlarged copy of the Engel data of quantile_linreg_ex.py.
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from shared_arrays import SharedArray, attach
+
+QuantileGrid = collections.namedtuple(
+    'QuantileGrid', ['tau', 'b', 'bl', 'bu', 'ch', 'res', 'info'],
+)
+
+DEFAULT_OPTIONS = (
+    'Matrix Returned = Covariance',
+    'Interval Method = IID',
+)
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _init_worker(dat_spec, y_spec, res_spec, sorder, isx, options):
+    _worker['dat'] = attach(dat_spec)
+    _worker['y'] = attach(y_spec)
+    _worker['res'] = None if res_spec is None else attach(res_spec)
+    _worker['args'] = (sorder, isx, options)
+
+
+def fit_quantiles(sorder, dat, isx, y, tau, options=DEFAULT_OPTIONS,
+                  residuals=False):
+    """
+    One quantile_linreg call with the given options.
+
+    A NAG warning (e.g. for a quantile whose fit did not converge) is
+    issued with warnings.warn and the results are still returned; the info
+    array flags the affected quantiles.
+    """
+    from naginterfaces.library import correg
+    comm = {}
+    correg.optset('Initialize = quantile_linreg', comm)
+    correg.optset(
+        'Return Residuals = ' + ('Yes' if residuals else 'No'), comm)
+    for option in options:
+        correg.optset(option, comm)
+    return correg.quantile_linreg(sorder, dat, isx, y, tau, comm)
+
+
+def _fit_block(start, tau):
+    w = _worker
+    sorder, isx, options = w['args']
+    regn = fit_quantiles(
+        sorder, w['dat'], isx, w['y'], tau, options, w['res'] is not None,
+    )
+    if w['res'] is not None:
+        w['res'][:, start:start + len(tau)] = regn.res
+    return start, regn.b, regn.bl, regn.bu, regn.ch, getattr(regn, 'info', None)
+
+
+def split_tau(tau, block):
+    """
+    Return (start, tau block) pairs covering tau in blocks of block values.
+    """
+    tau = np.asarray(tau, dtype=float)
+    return [(start, tau[start:start + block])
+            for start in range(0, tau.size, block)]
+
+
+def fit_tau_grid(dat, y, tau, isx=None, sorder=1, options=DEFAULT_OPTIONS,
+                 block=10, processes=None, residuals=False):
+    """
+    Fit quantile_linreg for every value in tau on a process pool.
+
+    The arguments are those of quantile_linreg; options are applied with
+    correg.optset after initialization.  Returns a QuantileGrid whose res
+    is None unless residuals is true.
+    """
+    dat = np.asarray(dat, dtype=float)
+    if dat.ndim == 1:
+        dat = dat.reshape(-1, 1)
+    y = np.asarray(y, dtype=float)
+    tau = np.asarray(tau, dtype=float)
+    ntau = tau.size
+    if isx is None:
+        isx = [1] * (dat.shape[1] if sorder == 1 else dat.shape[0])
+
+    owned = [SharedArray.copy_of(dat, order='F'), SharedArray.copy_of(y)]
+    res_spec = None
+    if residuals:
+        owned.append(SharedArray((y.size, ntau), order='F'))
+        res_spec = owned[-1].spec
+
+    b = bl = bu = ch = info = None
+    try:
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker,
+                initargs=(owned[0].spec, owned[1].spec, res_spec, sorder,
+                          isx, tuple(options)),
+        ) as pool:
+            futures = [pool.submit(_fit_block, start, t)
+                       for start, t in split_tau(tau, block)]
+            for f in futures:
+                start, b_k, bl_k, bu_k, ch_k, info_k = f.result()
+                stop = start + b_k.shape[1]
+                if b is None:
+                    p = b_k.shape[0]
+                    b, bl, bu = [np.empty((p, ntau)) for _ in range(3)]
+                    if ch_k is not None and np.size(ch_k):
+                        ch = np.empty(ch_k.shape[:2] + (ntau,))
+                    if info_k is not None:
+                        info = np.zeros(ntau, dtype=np.asarray(info_k).dtype)
+                b[:, start:stop] = b_k
+                bl[:, start:stop] = bl_k
+                bu[:, start:stop] = bu_k
+                if ch is not None:
+                    ch[:, :, start:stop] = ch_k
+                if info is not None:
+                    info[start:stop] = info_k
+        res = owned[2].array.copy(order='F') if residuals else None
+    finally:
+        for shared in owned:
+            shared.close()
+
+    return QuantileGrid(tau, b, bl, bu, ch, res, info)
+
+
+def fit_tau_single(dat, y, tau, isx=None, sorder=1, options=DEFAULT_OPTIONS,
+                   residuals=False):
+    """
+    Fit the whole tau grid with one quantile_linreg call, for comparison.
+    """
+    dat = np.asarray(dat, dtype=float)
+    if dat.ndim == 1:
+        dat = dat.reshape(-1, 1)
+    if isx is None:
+        isx = [1] * (dat.shape[1] if sorder == 1 else dat.shape[0])
+    regn = fit_quantiles(
+        sorder, np.asfortranarray(dat), isx, np.asarray(y, dtype=float),
+        np.asarray(tau, dtype=float), options, residuals,
+    )
+    return QuantileGrid(
+        np.asarray(tau, dtype=float), regn.b, regn.bl, regn.bu, regn.ch,
+        regn.res if residuals else None, getattr(regn, 'info', None),
+    )
+
+
+def bench_split(dat, y, ntau=99, blocks=(5, 10, 25), processes=None,
+                residuals=False):
+    """
+    Time one call for ntau quantiles against the split fits.
+
+    Returns a list of (label, seconds, largest difference in b from the
+    single call) tuples.
+    """
+    tau = np.linspace(0.0, 1.0, ntau + 2)[1:-1]
+    t0 = time.perf_counter()
+    single = fit_tau_single(dat, y, tau, residuals=residuals)
+    rows = [('single call', time.perf_counter() - t0, 0.0)]
+    for block in blocks:
+        t0 = time.perf_counter()
+        grid = fit_tau_grid(dat, y, tau, block=block, processes=processes,
+                            residuals=residuals)
+        rows.append((
+            'blocks of {}'.format(block), time.perf_counter() - t0,
+            float(np.max(np.abs(grid.b - single.b))),
+        ))
+    return rows
+
+
+def main(reps=50, ntau=99):
+    """
+    Benchmark on reps noisy copies of the Engel data.
+    """
+    from quantile_linreg_ex import get_data
+
+    _, dat, y = get_data()
+    rng = np.random.RandomState(1)
+    dat = np.tile(dat, (reps, 1)) * rng.uniform(0.95, 1.05, (reps * len(y), 1))
+    y = np.tile(y, reps) * rng.uniform(0.95, 1.05, reps * len(y))
+    print('{} observations, {} quantiles'.format(len(y), ntau))
+    for label, seconds, diff in bench_split(dat, y, ntau):
+        print('{:15s} {:8.3f}s  max |b - b_single| = {:.2e}'.format(
+            label, seconds, diff))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Bootstrap and k-fold cross-validation refits of linear regression models.
+
+Model selection needs thousands of refits of correg.linregm_fit or
+correg.glm_normal on resampled data.  The functions here place x and y in
+shared memory once and hand the refits to a process pool.  Bootstrap
+replicates are drawn in blocks; every block gets its own repeatable
+Wichmann-Hill I stream from rand.init_repeat (subid and seed derived from
+the block number), so the result does not depend on how the blocks are spread
+over the workers.  Cross-validation folds are drawn once in the parent and
+sent to the workers as index sets.  Only the coefficient arrays come back,
+not the full result objects.
+
+Example, with the data of reg-a.ipynb:
+
+    boot = bootstrap(x, y, 2000, isx=isx, seed=32958)
+    boot.b.std(axis=0)          # bootstrap standard errors
+    cv = kfold(x, y, 10, fitter='glm_normal', link='I')
+    cv.mse.mean()
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from shared_arrays import SharedArray, attach
+
+ResampleResult = collections.namedtuple(
+    'ResampleResult', ['b', 'se', 'rss', 'mse', 'failed'],
+)
+ResampleResult.__doc__ = """
+Coefficients of every refit, one row per replicate or fold.
+
+b, se  -- (nrep, p) estimates and their standard errors
+rss    -- (nrep,) residual sum of squares (the deviance for glm_normal)
+mse    -- (nrep,) mean squared error on the held-out rows (k-fold with the
+          identity link only, NaN otherwise)
+failed -- indices of the refits that raised a NAG error (rows set to NaN)
+"""
+
+# Wichmann-Hill I (genid=2) has 273 independent generators, selected by
+# subid; the other generators ignore subid
+_GENID = 2
+_NSUBID = 273
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def nparams(m, isx=None, mean='M'):
+    """
+    The number of coefficients fitted for m variables selected by isx.
+    """
+    nx = m if isx is None else int(np.sum(np.asarray(isx) > 0))
+    return nx + (mean == 'M')
+
+
+def block_statecomm(seed, block):
+    """
+    Return the NAG generator state for bootstrap block number block.
+
+    Every block has its own stream, also across the change of seed after
+    every _NSUBID blocks:
+
+    >>> from naginterfaces.library import rand
+    >>> draws = [tuple(rand.dist_uniform01(4, block_statecomm(1, block)))
+    ...          for block in (0, 1, _NSUBID)]
+    >>> len(set(draws))
+    3
+    """
+    from naginterfaces.library import rand
+    return rand.init_repeat(
+        genid=_GENID, subid=block % _NSUBID + 1,
+        seed=[seed + block // _NSUBID],
+    )
+
+
+def resample_rows(n, statecomm):
+    """
+    Draw the n row indices of one bootstrap resample from statecomm.
+
+    Successive calls continue the stream, so a block's replicates are the
+    same as if they were drawn at once, without holding all of them.
+    """
+    from naginterfaces.library import rand
+    u = rand.dist_uniform01(n, statecomm)
+    return np.minimum((np.asarray(u) * n).astype(np.intp), n - 1)
+
+
+def _init_worker(x_spec, y_spec, fitter, isx, kwargs):
+    from naginterfaces.base import utils
+    from naginterfaces.library import correg
+    _worker['x'] = attach(x_spec)
+    _worker['y'] = attach(y_spec)
+    _worker['fit'] = getattr(correg, fitter)
+    _worker['isx'] = isx
+    _worker['kwargs'] = kwargs
+    _worker['error'] = utils.NagException
+
+
+def _refit(rows):
+    """
+    Fit the model to the given rows; return (b, se, rss) or None on error.
+    """
+    w = _worker
+    x = np.asfortranarray(w['x'][rows])
+    y = w['y'][rows]
+    try:
+        fit = w['fit'](x, w['isx'], y, **w['kwargs'])
+    except w['error']:
+        return None
+    rss = getattr(fit, 'rss', getattr(fit, 'dev', np.nan))
+    return fit.b, fit.se, rss
+
+
+def _bootstrap_block(seed, block, count, p):
+    n = _worker['y'].shape[0]
+    statecomm = block_statecomm(seed, block)
+
+    b = np.full((count, p), np.nan)
+    se = np.full((count, p), np.nan)
+    rss = np.full(count, np.nan)
+    for r in range(count):
+        res = _refit(resample_rows(n, statecomm))
+        if res is not None:
+            b[r], se[r], rss[r] = res
+    return b, se, rss
+
+
+def _fold(test, p, mean, linear):
+    w = _worker
+    n = w['y'].shape[0]
+    train = np.setdiff1d(np.arange(n), test, assume_unique=True)
+    res = _refit(train)
+    if res is None:
+        return np.full(p, np.nan), np.full(p, np.nan), np.nan, np.nan
+    b, se, rss = res
+    mse = np.nan
+    if linear:
+        sel = np.asarray(w['isx']) > 0
+        yhat = w['x'][test][:, sel] @ b[(mean == 'M'):]
+        if mean == 'M':
+            yhat += b[0]
+        mse = float(np.mean((w['y'][test] - yhat) ** 2))
+    return b, se, rss, mse
+
+
+def _pool(x, y, fitter, isx, kwargs, processes):
+    sx = SharedArray.copy_of(np.asarray(x, dtype=float))
+    sy = SharedArray.copy_of(np.asarray(y, dtype=float))
+    pool = ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker,
+        initargs=(sx.spec, sy.spec, fitter, isx, kwargs),
+    )
+    return pool, (sx, sy)
+
+
+def bootstrap(x, y, nrep, isx=None, fitter='linregm_fit', seed=1,
+              processes=None, block=50, **kwargs):
+    """
+    Refit the model to nrep bootstrap resamples of the rows of (x, y).
+
+    fitter is 'linregm_fit' or 'glm_normal'; kwargs are passed to it and
+    must be picklable.  isx defaults to including every variable.
+    """
+    x = np.asarray(x, dtype=float)
+    if isx is None:
+        isx = np.ones(x.shape[1], dtype=int)
+    p = nparams(x.shape[1], isx, kwargs.get('mean', 'M'))
+    blocks = [(i, min(block, nrep - i * block))
+              for i in range(-(-nrep // block))]
+
+    pool, shared = _pool(x, y, fitter, isx, kwargs, processes)
+    try:
+        with pool:
+            parts = [f.result() for f in [
+                pool.submit(_bootstrap_block, seed, i, count, p)
+                for i, count in blocks
+            ]]
+    finally:
+        for s in shared:
+            s.close()
+
+    b, se, rss = [np.concatenate(a) for a in zip(*parts)]
+    return ResampleResult(
+        b, se, rss, np.full(nrep, np.nan), np.flatnonzero(np.isnan(b[:, 0])),
+    )
+
+
+def kfold(x, y, k, isx=None, fitter='linregm_fit', seed=1, processes=None,
+          **kwargs):
+    """
+    Refit the model leaving out each of k random folds of the rows.
+
+    The held-out mean squared error is computed for linregm_fit and for
+    glm_normal with the identity link.
+    """
+    from naginterfaces.library import rand
+    x = np.asarray(x, dtype=float)
+    if isx is None:
+        isx = np.ones(x.shape[1], dtype=int)
+    mean = kwargs.get('mean', 'M')
+    p = nparams(x.shape[1], isx, mean)
+    linear = fitter == 'linregm_fit' or kwargs.get('link', 'I') == 'I'
+
+    n = x.shape[0]
+    statecomm = rand.init_repeat(genid=3, seed=[seed])
+    perm = np.argsort(rand.dist_uniform01(n, statecomm), kind='stable')
+    folds = np.array_split(perm, k)
+
+    pool, shared = _pool(x, y, fitter, isx, kwargs, processes)
+    try:
+        with pool:
+            parts = [f.result() for f in [
+                pool.submit(_fold, np.sort(test), p, mean, linear)
+                for test in folds
+            ]]
+    finally:
+        for s in shared:
+            s.close()
+
+    b, se, rss, mse = [np.array(a) for a in zip(*parts)]
+    return ResampleResult(b, se, rss, mse, np.flatnonzero(np.isnan(b[:, 0])))
@@ -0,0 +1,77 @@
+"""
+NumPy arrays in shared memory for process-pool workers.
+
+The parallel drivers in this directory place their input data in a
+multiprocessing.shared_memory block once, and send the workers a small
+picklable spec (name, shape, dtype) instead of the array itself.  Workers
+call attach() with the spec to get an ndarray view of the same memory.
+
+Example:
+
+    with SharedArray.copy_of(x) as sx:
+        pool = ProcessPoolExecutor(initializer=init, initargs=(sx.spec,))
+        ...
+
+    def init(spec):
+        global X
+        X = attach(spec)
+"""
+# pylint: disable=invalid-name
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Blocks attached in this process, kept open while their arrays are in use
+_attached = {}
+
+
+class SharedArray:
+    """
+    An ndarray backed by a shared memory block owned by this process.
+
+    The block is unlinked by close(), or on leaving a with block.
+    """
+    def __init__(self, shape, dtype=np.float64, order='C'):
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf,
+                                order=order)
+        self.spec = (self.shm.name, tuple(shape), dtype.str, order)
+
+    @classmethod
+    def copy_of(cls, a, order='C'):
+        """
+        Return a SharedArray holding a copy of a.
+        """
+        a = np.asarray(a)
+        shared = cls(a.shape, a.dtype, order)
+        shared.array[...] = a
+        return shared
+
+    def close(self):
+        """
+        Release and unlink the shared memory block.
+        """
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(spec):
+    """
+    Return an ndarray view of the shared block described by spec.
+    """
+    name, shape, dtype, order = spec
+    shm = _attached.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf,
+                      order=order)
@@ -0,0 +1,198 @@
+"""
+Callback time versus engine time for the opt and glopt solvers.
+
+When opt.handle_solve_bxnl or handle_solve_bounds_foas is slow it is not
+obvious whether the time goes to the Python callbacks (objfun, objgrd,
+lsqfun, lsqgrd, ...) or to the NAG engine.  SolverProfiler.call() runs a
+solver with every callback argument wrapped in a timer, counts the calls,
+and reports the engine time as the total time less the time spent in
+callbacks.  The time between monit calls gives the wall time per
+iteration, so set the solver's monitor frequency option (e.g. 'FOAS
+Monitor Frequency = 1') to get it; if no monit is passed the profiler
+supplies one.  Each callback costs two perf_counter() calls and, with
+trace=True, one tuple in a list, so the profiler can be left on; the
+events can be written as a Chrome trace (chrome://tracing, Perfetto).
+
+Example, with the problem of handle_solve_bounds_foas_ex.py:
+
+    prof = SolverProfiler(trace=True)
+    ret = prof.call(opt.handle_solve_bounds_foas, handle, objfun, objgrd,
+                    x, monit=monit, io_manager=iom)
+    print(prof.format_report())
+    prof.save_trace('foas_trace.json')
+"""
+# pylint: disable=invalid-name,too-many-instance-attributes
+import inspect
+import json
+import time
+
+import numpy as np
+
+# The callback arguments of the opt and glopt solvers
+CALLBACKS = (
+    'objfun', 'objgrd', 'confun', 'congrd', 'hess', 'hesfun', 'hesprd',
+    'lsqfun', 'lsqgrd', 'lsqhes', 'lsqhprd', 'monit', 'monmod',
+)
+
+
+class SolverProfiler:
+    """
+    Timings of the callbacks and iterations of solver calls.
+
+    The timings of successive call()s accumulate until reset().  With trace,
+    at most max_events callback events are kept for save_trace().
+    """
+    def __init__(self, trace=False, max_events=10**6):
+        self.trace = trace
+        self.max_events = max_events
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every timing.
+        """
+        self.solves = 0
+        self.total_time = 0.0
+        self._callbacks = {}
+        self._iterations = []
+        self._events = []
+        self._solve_spans = []
+        self._t0 = time.perf_counter()
+
+    def _timed(self, name, fun):
+        counter = self._callbacks.setdefault(name, [0, 0.0])
+        events = self._events if self.trace else None
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                stop = clock()
+                counter[0] += 1
+                counter[1] += stop - start
+                if events is not None and len(events) < self.max_events:
+                    events.append((name, start, stop))
+        return timed
+
+    def _monit(self, fun, stamps):
+        def monit(*args, **kwargs):
+            stamps.append(time.perf_counter())
+            if fun is not None:
+                return fun(*args, **kwargs)
+            return None
+        return self._timed('monit', monit)
+
+    def call(self, solve, *args, **kwargs):
+        """
+        Run solve(*args, **kwargs) with its callbacks timed.
+
+        Returns what solve returns; NAG exceptions are passed on after the
+        timings have been recorded.
+        """
+        try:
+            bound = inspect.signature(solve).bind(*args, **kwargs)
+        except (TypeError, ValueError):
+            bound = None
+        arguments = bound.arguments if bound is not None else kwargs
+        stamps = []
+        for name in CALLBACKS:
+            fun = arguments.get(name)
+            if name == 'monit':
+                if fun is not None or bound is not None and \
+                        'monit' in bound.signature.parameters:
+                    arguments['monit'] = self._monit(fun, stamps)
+            elif callable(fun):
+                arguments[name] = self._timed(name, fun)
+        if bound is not None:
+            args, kwargs = bound.args, bound.kwargs
+
+        start = time.perf_counter()
+        stamps.append(start)
+        try:
+            return solve(*args, **kwargs)
+        finally:
+            stop = time.perf_counter()
+            stamps.append(stop)
+            self.solves += 1
+            self.total_time += stop - start
+            self._iterations.append(np.diff(stamps))
+            self._solve_spans.append(
+                (getattr(solve, '__name__', 'solve'), start, stop))
+
+    def iteration_times(self):
+        """
+        The wall time of every iteration (between monit calls) of every
+        solve, the last one running up to the solver's return.
+        """
+        if not self._iterations:
+            return np.empty(0)
+        return np.concatenate(self._iterations)
+
+    def report(self):
+        """
+        Return the timings as a dict.
+        """
+        callbacks = {
+            name: {
+                'calls': calls,
+                'time': seconds,
+                'mean': seconds / calls if calls else 0.0,
+            }
+            for name, (calls, seconds) in self._callbacks.items()
+        }
+        callback_time = sum(c['time'] for c in callbacks.values())
+        engine_time = self.total_time - callback_time
+        iterations = self.iteration_times()
+        return {
+            'solves': self.solves,
+            'total_time': self.total_time,
+            'callback_time': callback_time,
+            'engine_time': engine_time,
+            'engine_fraction': (engine_time / self.total_time
+                                if self.total_time else 0.0),
+            'callbacks': callbacks,
+            'iterations': int(iterations.size),
+            'iteration_time_mean': (float(iterations.mean())
+                                    if iterations.size else 0.0),
+            'iteration_time_max': (float(iterations.max())
+                                   if iterations.size else 0.0),
+        }
+
+    def format_report(self):
+        """
+        The report as a table.
+        """
+        rep = self.report()
+        lines = [
+            '{} solve(s) in {:.4f}s: engine {:.4f}s ({:.1%}), '
+            'callbacks {:.4f}s'.format(
+                rep['solves'], rep['total_time'], rep['engine_time'],
+                rep['engine_fraction'], rep['callback_time'],
+            ),
+            '{:10s} {:>10s} {:>12s} {:>12s}'.format(
+                'callback', 'calls', 'time (s)', 'mean (s)'),
+        ]
+        for name, c in sorted(rep['callbacks'].items(),
+                              key=lambda item: -item[1]['time']):
+            lines.append('{:10s} {:10d} {:12.6f} {:12.3e}'.format(
+                name, c['calls'], c['time'], c['mean']))
+        lines.append('{} iterations, mean {:.3e}s, max {:.3e}s'.format(
+            rep['iterations'], rep['iteration_time_mean'],
+            rep['iteration_time_max']))
+        return '\n'.join(lines)
+
+    def save_trace(self, path):
+        """
+        Write the solves and callback events as Chrome trace JSON.
+        """
+        def event(name, start, stop, tid):
+            return {
+                'name': name, 'ph': 'X', 'pid': 0, 'tid': tid,
+                'ts': (start - self._t0) * 1e6, 'dur': (stop - start) * 1e6,
+            }
+        events = [event(*span, tid=0) for span in self._solve_spans]
+        events += [event(*e, tid=1) for e in self._events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
@@ -0,0 +1,162 @@
+"""
+Sparse Jacobians for opt.handle_set_nlnls, found by probing lsqfun.
+
+The NLLS examples call opt.handle_set_nlnls(handle, nres, irowrd=None,
+icolrd=None), which declares a dense nres x nvar Jacobian.  For fitting
+problems with thousands of parameters and a block-sparse Jacobian this
+wastes memory, and finite differences cost one residual evaluation per
+parameter.  detect_sparsity() finds the structure by perturbing one
+variable at a time at a few random points near x0 and noting which
+residuals change.  SparseJacobian passes the pattern to handle_set_nlnls
+and, when no lsqgrd is given, provides one that estimates the Jacobian by
+finite differences over groups of structurally orthogonal columns (a
+greedy colouring of the column intersection graph), so one evaluation of
+lsqfun yields every column of a group.
+
+Example, with lsqfun of the NLLS exercises:
+
+    jac = SparseJacobian(lsqfun, nvar, nres, x0, data=data)
+    handle = opt.handle_init(nvar)
+    jac.setup(handle)
+    res = opt.handle_solve_bxnl(handle, lsqfun, jac.lsqgrd, x0, nres,
+                                data=data, io_manager=iom)
+    jac.ncolors, jac.nfun
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-instance-attributes
+import numpy as np
+from scipy import sparse
+
+
+def _residuals(lsqfun, x, nres, args):
+    rx, _ = lsqfun(x, nres, 0, *args)
+    return np.asarray(rx, dtype=float)
+
+
+def detect_sparsity(lsqfun, x0, nres, data=None, nprobe=2, spread=1.0e-2,
+                    seed=1):
+    """
+    Return (rows, cols): the 0-based non-zeros of the Jacobian, row-major.
+
+    Each of nprobe random points within spread (relative) of x0 costs
+    nvar + 1 evaluations of lsqfun(x, nres, inform[, data]).  Entries that
+    vanish at every probe point are taken to be structurally zero.
+    """
+    args = () if data is None else (data,)
+    x0 = np.asarray(x0, dtype=float)
+    n = x0.size
+    rng = np.random.RandomState(seed)
+    found = np.zeros((nres, n), dtype=bool)
+    for _ in range(nprobe):
+        x = x0 + spread * (np.abs(x0) + 1.0) * rng.uniform(-1.0, 1.0, n)
+        r0 = _residuals(lsqfun, x, nres, args)
+        h = np.sqrt(np.finfo(float).eps) * (np.abs(x) + 1.0)
+        for j in range(n):
+            xj = x[j]
+            x[j] = xj + h[j]
+            found[:, j] |= _residuals(lsqfun, x, nres, args) != r0
+            x[j] = xj
+    rows, cols = np.nonzero(found)
+    return rows, cols
+
+
+def color_columns(rows, cols, nres, nvar):
+    """
+    Greedy colouring of the columns so that no two in a colour share a row.
+
+    Columns are coloured in order of decreasing degree in the intersection
+    graph.  Returns an array with the colour of every column.
+
+    The overlap counts are kept in int64: with a narrow type two columns
+    sharing, say, exactly 256 rows would wrap round to zero and be put in
+    the same colour.
+
+    Three columns that all share the same 256 rows need three colours:
+
+    >>> rows = np.tile(np.arange(256), 3)
+    >>> cols = np.repeat([0, 1, 2], 256)
+    >>> color_columns(rows, cols, 256, 3)
+    array([0, 1, 2])
+    """
+    pattern = sparse.csr_matrix(
+        (np.ones(rows.size, dtype=np.int64), (rows, cols)), shape=(nres, nvar))
+    conflict = ((pattern.T @ pattern) != 0).tocsr()
+    conflict.setdiag(False)
+    conflict.eliminate_zeros()
+    order = np.argsort(-np.diff(conflict.indptr), kind='stable')
+    colors = np.full(nvar, -1, dtype=np.int64)
+    for j in order:
+        used = colors[conflict.indices[conflict.indptr[j]:conflict.indptr[j + 1]]]
+        taken = np.zeros(used.size + 1, dtype=bool)
+        taken[used[(used >= 0) & (used <= used.size)]] = True
+        colors[j] = np.argmin(taken)
+    return colors
+
+
+class SparseJacobian:
+    """
+    The sparsity pattern, and optionally a coloured finite-difference
+    lsqgrd, for handle_solve_bxnl.
+
+    pattern=(rows, cols) skips the detection.  With lsqgrd given, the
+    pattern is only used for handle_set_nlnls and lsqgrd is called as is;
+    it must fill rdx in the order of irowrd/icolrd.
+    """
+    def __init__(self, lsqfun, nvar, nres, x0, data=None, lsqgrd=None,
+                 pattern=None, **detect):
+        from naginterfaces.base import utils
+        self.lsqfun = lsqfun
+        self.user_lsqgrd = lsqgrd
+        self.nvar = nvar
+        self.nres = nres
+        self.nfun = 0
+        if pattern is None:
+            pattern = detect_sparsity(lsqfun, x0, nres, data, **detect)
+            self.nfun += detect.get('nprobe', 2) * (nvar + 1)
+        rows, cols = [np.asarray(a, dtype=np.int64) for a in pattern]
+        order = np.lexsort((cols, rows))
+        self.rows, self.cols = rows[order], cols[order]
+        self.irowrd = (self.rows + 1).astype(utils.EngineIntCType)
+        self.icolrd = (self.cols + 1).astype(utils.EngineIntCType)
+        self.colors = color_columns(self.rows, self.cols, nres, nvar)
+        self.ncolors = int(self.colors.max()) + 1 if nvar else 0
+        # The rdx entries filled from each colour's evaluation
+        entry_color = self.colors[self.cols]
+        self._groups = [
+            (np.flatnonzero(self.colors == c), np.flatnonzero(entry_color == c))
+            for c in range(self.ncolors)
+        ]
+
+    @property
+    def nnz(self):
+        """
+        The number of structural non-zeros.
+        """
+        return self.rows.size
+
+    def setup(self, handle):
+        """
+        Declare the residuals with the sparse Jacobian on handle.
+        """
+        from naginterfaces.library import opt
+        opt.handle_set_nlnls(
+            handle, self.nres, irowrd=self.irowrd, icolrd=self.icolrd)
+
+    def lsqgrd(self, x, nres, rdx, inform, data=None):
+        """
+        Fill rdx with the Jacobian entries at x.
+        """
+        args = () if data is None else (data,)
+        if self.user_lsqgrd is not None:
+            return self.user_lsqgrd(x, nres, rdx, inform, *args)
+        x = np.array(x, dtype=float)
+        r0 = _residuals(self.lsqfun, x, nres, args)
+        h = np.sqrt(np.finfo(float).eps) * (np.abs(x) + 1.0)
+        for columns, entries in self._groups:
+            xp = x.copy()
+            xp[columns] += h[columns]
+            dx = xp - x
+            rp = _residuals(self.lsqfun, xp, nres, args)
+            rows = self.rows[entries]
+            rdx[entries] = (rp[rows] - r0[rows]) / dx[self.cols[entries]]
+        self.nfun += self.ncolors + 1
+        return inform
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+LP models for the opt handle API from scipy.sparse matrices.
+
+production_planning.ipynb passes the constraint matrix to
+handle_set_linconstr as Python lists of 1-based row and column indices and
+values.  For models with millions of non-zeros, building such lists takes
+longer than the solve.  coo_arrays() converts any scipy.sparse matrix (or a
+dense array) to the 1-based coordinate arrays in one vectorized pass, and
+build_lp() creates a handle from the matrix, the objective and the bound
+vectors, with infinite bounds mapped to +-1e20.
+
+Run this file to time the conversion and the whole handle build, and the
+list building they replace, for 10^4, 10^6 and 10^7 non-zeros.
+
+Example:
+
+    handle = build_lp(A, cl, cu, c=c, bl=np.zeros(n), options=['Task = Max'])
+    res = opt.handle_solve_lp_ipm(handle, io_manager=iom)
+    opt.handle_free(handle)
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import time
+
+import numpy as np
+from scipy import sparse
+
+INF_BOUND = 1.0e20
+
+
+def _index_dtype():
+    from naginterfaces.base import utils
+    return np.dtype(utils.EngineIntCType)
+
+
+def coo_arrays(a, index_dtype=None):
+    """
+    Return (irowb, icolb, b): the 1-based coordinates of the non-zeros of a.
+
+    a is a scipy.sparse matrix in any format, or a dense 2-D array.
+    Duplicate entries are summed, as handle_set_linconstr expects each
+    (row, column) pair once.  The index arrays have the NAG engine's
+    integer type unless index_dtype is given.
+    """
+    if index_dtype is None:
+        index_dtype = _index_dtype()
+    if sparse.issparse(a) and a.format in ('csr', 'csc'):
+        # Compressed formats sum duplicates without sorting all entries
+        if not a.has_canonical_format:
+            a = a.copy()
+            a.sum_duplicates()
+        coo = a.tocoo()
+    else:
+        coo = sparse.coo_matrix(a)
+        if not coo.has_canonical_format:
+            coo.sum_duplicates()
+    irowb = coo.row.astype(index_dtype)
+    icolb = coo.col.astype(index_dtype)
+    irowb += 1
+    icolb += 1
+    return irowb, icolb, np.ascontiguousarray(coo.data, dtype=np.float64)
+
+
+def finite_bounds(v, size, fill):
+    """
+    v as a float vector of length size with infinities mapped to +-1e20.
+
+    v may be None (every entry fill) or a scalar.
+    """
+    if v is None:
+        v = fill
+    return np.clip(np.broadcast_to(np.asarray(v, dtype=np.float64), (size,)),
+                   -INF_BOUND, INF_BOUND)
+
+
+def set_linconstr(handle, a, cl, cu):
+    """
+    Add the constraints cl <= a x <= cu to handle; return their block id.
+    """
+    from naginterfaces.library import opt
+    irowb, icolb, b = coo_arrays(a)
+    m = a.shape[0]
+    return opt.handle_set_linconstr(
+        handle, bl=finite_bounds(cl, m, -np.inf),
+        bu=finite_bounds(cu, m, np.inf), irowb=irowb, icolb=icolb, b=b,
+    )
+
+
+def build_lp(a, cl, cu, c=None, bl=None, bu=None, options=()):
+    """
+    Create a handle for: optimize c x, bl <= x <= bu, cl <= a x <= cu.
+
+    Missing bounds are infinite; a missing c leaves a feasibility problem.
+    The caller must free the handle.
+    """
+    from naginterfaces.library import opt
+    n = a.shape[1]
+    handle = opt.handle_init(n)
+    if c is not None:
+        opt.handle_set_linobj(
+            handle, cvec=np.ascontiguousarray(c, dtype=np.float64))
+    opt.handle_set_simplebounds(
+        handle, bl=finite_bounds(bl, n, -np.inf),
+        bu=finite_bounds(bu, n, np.inf),
+    )
+    set_linconstr(handle, a, cl, cu)
+    for option in options:
+        opt.handle_opt_set(handle, option)
+    return handle
+
+
+def random_matrix(nnz, per_row=10, seed=1):
+    """
+    A random CSR matrix with about nnz non-zeros, per_row in each row.
+    """
+    rng = np.random.RandomState(seed)
+    m = max(1, nnz // per_row)
+    rows = np.repeat(np.arange(m), per_row)
+    cols = rng.randint(0, m, rows.size)
+    return sparse.csr_matrix(
+        (rng.uniform(-1.0, 1.0, rows.size), (rows, cols)), shape=(m, m))
+
+
+def _python_lists(a):
+    # The list building of production_planning.ipynb, for comparison
+    coo = a.tocoo()
+    irowb = [int(i) + 1 for i in coo.row]
+    icolb = [int(j) + 1 for j in coo.col]
+    b = [float(v) for v in coo.data]
+    return irowb, icolb, b
+
+
+def _build_lp_lists(a, cl, cu, c):
+    # build_lp() with the constraint lists of _python_lists()
+    from naginterfaces.library import opt
+    m, n = a.shape
+    handle = opt.handle_init(n)
+    opt.handle_set_linobj(handle, cvec=list(c))
+    opt.handle_set_simplebounds(
+        handle, bl=[-INF_BOUND] * n, bu=[INF_BOUND] * n)
+    irowb, icolb, b = _python_lists(a)
+    opt.handle_set_linconstr(
+        handle, bl=[max(v, -INF_BOUND) for v in cl],
+        bu=[min(v, INF_BOUND) for v in cu], irowb=irowb, icolb=icolb, b=b,
+    )
+    return handle
+
+
+def _timed(build, *args):
+    # The seconds taken to build a handle and free it
+    from naginterfaces.library import opt
+    t0 = time.perf_counter()
+    handle = build(*args)
+    opt.handle_free(handle)
+    return time.perf_counter() - t0
+
+
+def bench_build(sizes=(10**4, 10**6, 10**7), list_limit=10**6):
+    """
+    Time coo_arrays() and build_lp() (from CSR and CSC) against the Python
+    list building.
+
+    build_lp is timed together with handle_free, and so is the list
+    version, which builds the same handle from Python lists.  The lists are
+    only built up to list_limit non-zeros.  The index arrays have the NAG
+    engine's integer type.  Returns a list of (nnz, format, method,
+    seconds) tuples.
+    """
+    rows = []
+    for size in sizes:
+        a = random_matrix(size)
+        nnz = a.nnz
+        m, n = a.shape
+        cl = np.full(m, -np.inf)
+        cu = np.ones(m)
+        c = np.ones(n)
+        for fmt in ('csr', 'csc'):
+            mat = a.asformat(fmt)
+            t0 = time.perf_counter()
+            coo_arrays(mat)
+            rows.append((nnz, fmt, 'coo_arrays', time.perf_counter() - t0))
+            rows.append((nnz, fmt, 'build_lp',
+                         _timed(build_lp, mat, cl, cu, c)))
+        if nnz <= list_limit:
+            t0 = time.perf_counter()
+            _python_lists(a)
+            rows.append((nnz, 'csr', 'python lists', time.perf_counter() - t0))
+            rows.append((nnz, 'csr', 'lists build',
+                         _timed(_build_lp_lists, a, cl, cu, c)))
+    return rows
+
+
+def main():
+    """
+    Print the build-time benchmark.
+    """
+    print('{:>10s} {:>5s} {:>14s} {:>10s}'.format(
+        'nnz', 'fmt', 'method', 'seconds'))
+    for nnz, fmt, method, seconds in bench_build():
+        print('{:10d} {:>5s} {:>14s} {:10.4f}'.format(
+            nnz, fmt, method, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Out-of-core multiple linear regression.
+
+correg.linregm_fit needs the whole design matrix in memory.  StreamingLinReg
+fits the same model from row chunks: it keeps the (p+1) by (p+1) triangular
+factor of the QR decomposition of [X y] and updates it with every chunk, so
+memory stays O(p^2) however many rows there are.  States built from
+separate parts of the data can be merged, which allows the chunks to be
+accumulated in parallel.  The coefficients, standard errors, covariance
+matrix, residual sum of squares and degrees of freedom match those of
+linregm_fit for a full-rank, unweighted model.
+
+Example:
+
+    reg = StreamingLinReg(m)
+    for x, y in iter_npy_chunks('x.npy', 'y.npy', 1000000):
+        reg.update(x, y)
+    fit = reg.result()
+    fit.b, fit.se, fit.rss
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import collections
+import itertools
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+LinRegResult = collections.namedtuple(
+    'LinRegResult', ['b', 'se', 'cov', 'rss', 'idf', 'irank', 'nobs'],
+)
+
+
+class StreamingLinReg:
+    """
+    Accumulate a linear regression of y on m independent variables.
+
+    isx selects the variables to include (isx[j] > 0), as for linregm_fit,
+    and mean='M' adds an intercept as the first parameter while mean='Z'
+    fits the model through the origin.
+    """
+    def __init__(self, m, isx=None, mean='M'):
+        if mean not in ('M', 'Z'):
+            raise ValueError("mean must be 'M' or 'Z'")
+        self.m = m
+        self.isx = np.ones(m, dtype=bool) if isx is None else np.asarray(isx) > 0
+        self.mean = mean
+        self.p = int(self.isx.sum()) + (mean == 'M')
+        # Upper triangular factor of [X y]; the last diagonal entry squared
+        # is the residual sum of squares of the data seen so far
+        self.r = np.zeros((self.p + 1, self.p + 1))
+        self.nobs = 0
+
+    def _design(self, x, y):
+        x = np.asarray(x, dtype=float).reshape(-1, self.m)
+        y = np.asarray(y, dtype=float).reshape(-1)
+        if x.shape[0] != y.shape[0]:
+            raise ValueError('x and y must have the same number of rows')
+        a = np.empty((x.shape[0], self.p + 1))
+        col = 0
+        if self.mean == 'M':
+            a[:, 0] = 1.0
+            col = 1
+        a[:, col:self.p] = x[:, self.isx]
+        a[:, self.p] = y
+        return a
+
+    def update(self, x, y):
+        """
+        Add the rows of x (k, m) and y (k,) to the fit.
+        """
+        a = self._design(x, y)
+        if a.shape[0] == 0:
+            return self
+        self.r = np.linalg.qr(np.vstack((self.r, a)), mode='r')[:self.p + 1]
+        self.nobs += a.shape[0]
+        return self
+
+    def merge(self, other):
+        """
+        Add the data accumulated in other, a state for the same model.
+        """
+        if (other.m, other.p, other.mean) != (self.m, self.p, self.mean) or \
+                not np.array_equal(other.isx, self.isx):
+            raise ValueError('cannot merge states of different models')
+        self.r = np.linalg.qr(np.vstack((self.r, other.r)), mode='r')
+        self.nobs += other.nobs
+        return self
+
+    def result(self, tol=1.0e-12):
+        """
+        Return the fitted model as a LinRegResult.
+
+        cov is the full p by p covariance matrix of the estimates
+        (linregm_fit returns its upper triangle packed by columns).
+        """
+        r = self.r[:self.p, :self.p]
+        d = np.abs(np.diag(r))
+        irank = int(np.sum(d > tol * max(d.max(), 1.0))) if self.p else 0
+        if irank < self.p:
+            raise ValueError(
+                'the model is not of full rank ({} < {})'.format(irank, self.p))
+        b = solve_triangular(r, self.r[:self.p, self.p])
+        rss = float(self.r[self.p, self.p] ** 2)
+        idf = self.nobs - self.p
+        rinv = solve_triangular(r, np.eye(self.p))
+        cov = (rss / idf if idf > 0 else 0.0) * (rinv @ rinv.T)
+        se = np.sqrt(np.diag(cov))
+        return LinRegResult(b, se, cov, rss, idf, irank, self.nobs)
+
+
+def fit_chunks(chunks, m, isx=None, mean='M'):
+    """
+    Fit the model to an iterable of (x, y) chunks and return the result.
+    """
+    reg = StreamingLinReg(m, isx, mean)
+    for x, y in chunks:
+        reg.update(x, y)
+    return reg.result()
+
+
+def iter_array_chunks(x, y, chunk_rows):
+    """
+    Yield (x, y) row chunks of two arrays, e.g. memory-mapped ones.
+    """
+    for start in range(0, x.shape[0], chunk_rows):
+        stop = start + chunk_rows
+        yield np.asarray(x[start:stop]), np.asarray(y[start:stop])
+
+
+def iter_npy_chunks(x_path, y_path, chunk_rows):
+    """
+    Yield (x, y) row chunks of .npy files without loading them whole.
+    """
+    x = np.load(x_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    return iter_array_chunks(x, y, chunk_rows)
+
+
+def iter_csv_chunks(path, y_col, chunk_rows, x_cols=None, delimiter=',',
+                    skip_header=1):
+    """
+    Yield (x, y) row chunks of a CSV file.
+
+    y_col is the index of the dependent variable and x_cols the indices of
+    the independent ones (all the other columns by default).
+    """
+    with open(path) as f:
+        for _ in range(skip_header):
+            next(f)
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            data = np.loadtxt(lines, delimiter=delimiter, ndmin=2)
+            if x_cols is None:
+                x_cols = [j for j in range(data.shape[1]) if j != y_col]
+            yield data[:, x_cols], data[:, y_col]
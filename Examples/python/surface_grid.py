@@ -0,0 +1,282 @@
+"""
+Objective surfaces on large grids for plotting and checking solutions.
+
+bnd_mcs_solve_ex.py, handle_solve_bounds_foas_ex.py and
+opt-noise-dfo-a.ipynb fill their 101 x 101 or 240 x 240 plotting grids
+with nested loops that call objfun([x_i, y_j], ...) once per point.
+evaluate_surface() first checks, on a few points, whether the objective
+gives the same values when called with whole arrays of x and y (which it
+does when it is written with NumPy operations), and then evaluates the
+grid in that form.  Objectives that only accept scalars are evaluated tile
+by tile on a process pool.  Computed tiles are kept in a TileCache keyed on
+the objective and the tile's place on a lattice of grid points, so
+redrawing a surface does not evaluate them again.  With step=(hx, hy) the
+grid is made of the multiples of hx and hy inside xlim and ylim, and
+whole tiles, fixed blocks of tile x tile lattice points, are evaluated and
+cached even where they reach past the edge of the view, so views that are
+panned or zoomed without changing the step share every tile they overlap.
+
+Example, with objfun of handle_solve_bounds_foas_ex.py:
+
+    cache = TileCache()
+    X, Y, Z = evaluate_surface(objfun, (-1.5, 1.3), (-2.5, 2.5),
+                               step=(0.02, 0.02), args=(1,), cache=cache)
+    ax.plot_surface(X, Y, Z)
+    # Zoom in: the tiles of the new view come from the cache
+    X, Y, Z = evaluate_surface(objfun, (-0.5, 1.0), (-1.0, 1.0),
+                               step=(0.02, 0.02), args=(1,), cache=cache)
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# The state of a worker process, set by _init_worker
+_worker = {}
+
+
+def _value(result):
+    # objfun returns f (MCS) or (f, inform) (handle solvers)
+    return result[0] if isinstance(result, tuple) else result
+
+
+def _init_worker(objfun, args):
+    _worker['objfun'] = objfun
+    _worker['args'] = args
+
+
+def _scalar_tile(objfun, args, xs, ys):
+    z = np.empty((xs.size, ys.size))
+    for i, x in enumerate(xs):
+        for j, y in enumerate(ys):
+            z[i, j] = _value(objfun(np.array([x, y]), *args))
+    return z
+
+
+def _worker_tile(xs, ys):
+    return _scalar_tile(_worker['objfun'], _worker['args'], xs, ys)
+
+
+def broadcasts(objfun, args, xs, ys):
+    """
+    Whether objfun([X, Y], *args) on arrays matches the scalar calls.
+
+    Checked on a 2 x 2 grid from the corners of xs and ys.
+    """
+    px = np.array([xs[0], xs[-1]])
+    py = np.array([ys[0], ys[-1]])
+    X, Y = np.meshgrid(px, py, indexing='ij')
+    try:
+        Z = np.asarray(_value(objfun([X, Y], *args)), dtype=float)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    if Z.shape != X.shape:
+        return False
+    return np.allclose(Z, _scalar_tile(objfun, args, px, py), equal_nan=True)
+
+
+class TileCache:
+    """
+    An LRU cache of surface tiles bounded by max_bytes.
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._tiles = collections.OrderedDict()
+
+    @staticmethod
+    def key(fun_key, xtile, ytile):
+        """
+        The key of a tile of an objective.
+
+        xtile and ytile are (origin, step, start, stop): the tile covers
+        the points origin + k*step for k in range(start, stop).
+        """
+        return (fun_key, xtile, ytile)
+
+    def get(self, key):
+        """
+        The cached tile for key, or None.
+        """
+        z = self._tiles.get(key)
+        if z is None:
+            self.misses += 1
+        else:
+            self._tiles.move_to_end(key)
+            self.hits += 1
+        return z
+
+    def put(self, key, z):
+        """
+        Store a tile, evicting the least recently used ones.
+        """
+        if z.nbytes > self.max_bytes:
+            return
+        while self._tiles and self.nbytes + z.nbytes > self.max_bytes:
+            _, old = self._tiles.popitem(last=False)
+            self.nbytes -= old.nbytes
+        self._tiles[key] = z
+        self.nbytes += z.nbytes
+
+    def stats(self):
+        """
+        Return the cache counters as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'tiles': len(self._tiles),
+            'bytes': self.nbytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _fun_key(objfun, args):
+    # The key holds objfun itself, so it stays alive as long as its tiles
+    # are cached and its identity cannot be taken over by another object
+    try:
+        hash(objfun)
+    except TypeError:
+        raise ValueError('objfun is not hashable: pass key') from None
+    return (objfun, repr(args))
+
+
+def _lattice(lim, n, h):
+    # Return (origin, step, k0, k1): the points origin + k*step, k0 <= k <= k1
+    if h is None:
+        return lim[0], (lim[1] - lim[0]) / max(n - 1, 1), 0, n - 1
+    k0 = int(np.ceil(lim[0] / h - 1.0e-9))
+    k1 = int(np.floor(lim[1] / h + 1.0e-9))
+    if k1 < k0:
+        raise ValueError('no multiple of the step {} in {}'.format(h, lim))
+    return 0.0, h, k0, k1
+
+
+def _tiles(lattice, tile, whole):
+    # The lattice tiles [t*tile, (t+1)*tile) that overlap k0..k1, clipped
+    # to it unless whole
+    origin, h, k0, k1 = lattice
+    if whole:
+        return [(origin, h, t * tile, (t + 1) * tile)
+                for t in range(k0 // tile, k1 // tile + 1)]
+    return [
+        (origin, h, max(t * tile, k0), min((t + 1) * tile, k1 + 1))
+        for t in range(k0 // tile, k1 // tile + 1)
+    ]
+
+
+def _overlap(xtile, lattice):
+    # The slices of the view and of the tile where they overlap
+    _, _, start, stop = xtile
+    k0, k1 = lattice[2], lattice[3]
+    lo, hi = max(start, k0), min(stop, k1 + 1)
+    return slice(lo - k0, hi - k0), slice(lo - start, hi - start)
+
+
+def _points(xtile):
+    origin, h, start, stop = xtile
+    return origin + h * np.arange(start, stop)
+
+
+def evaluate_surface(objfun, xlim, ylim, shape=(101, 101), args=(0,),
+                     tile=64, processes=None, cache=None, key=None,
+                     vectorized=None, step=None):
+    """
+    Return X, Y, Z with Z[i, j] = objfun([X[i, j], Y[i, j]], *args).
+
+    The grid is np.linspace over xlim and ylim with the given shape and
+    'ij' indexing, as in the examples, or, with step=(hx, hy), the
+    multiples of hx and hy inside xlim and ylim (shape is then ignored);
+    the tiles then cover whole blocks of that lattice, so up to tile - 1
+    points beyond each edge of the view may be evaluated.
+    vectorized=None tests whether the objective broadcasts; True or False
+    forces the choice.  Scalar evaluation uses a process pool (processes=0
+    evaluates in this process, as happens anyway for objectives that
+    cannot be pickled).  key identifies the objective in cache, by default
+    the objective itself (which the cache then keeps alive) and args.
+
+    A zoom and a pan on the same lattice take all their tiles from the
+    cache:
+
+    >>> def paraboloid(x, inform):
+    ...     return x[0]**2 + x[1]**2, inform
+    >>> cache = TileCache()
+    >>> for xlim, ylim in [((-1.5, 1.3), (-2.5, 2.5)),
+    ...                    ((-0.5, 1.0), (-1.0, 1.0)),
+    ...                    ((-1.0, 0.8), (-2.0, 0.5))]:
+    ...     _ = evaluate_surface(paraboloid, xlim, ylim, step=(0.02, 0.02),
+    ...                          cache=cache)
+    ...     print(cache.hits, cache.misses)
+    0 16
+    4 16
+    10 16
+    """
+    hx, hy = (None, None) if step is None else step
+    xlat = _lattice(xlim, shape[0], hx)
+    ylat = _lattice(ylim, shape[1], hy)
+    xs = _points(xlat[:2] + (xlat[2], xlat[3] + 1))
+    ys = _points(ylat[:2] + (ylat[2], ylat[3] + 1))
+    Z = np.empty((xs.size, ys.size))
+    if cache is not None and key is None:
+        key = _fun_key(objfun, args)
+    whole = step is not None
+    tiles = [(xt, yt) for xt in _tiles(xlat, tile, whole)
+             for yt in _tiles(ylat, tile, whole)]
+
+    def place(xt, yt, z):
+        # Copy the part of a tile inside the view into Z
+        zx, tx = _overlap(xt, xlat)
+        zy, ty = _overlap(yt, ylat)
+        Z[zx, zy] = z[tx, ty]
+
+    todo = []
+    for xt, yt in tiles:
+        z = None
+        if cache is not None:
+            z = cache.get(TileCache.key(key, xt, yt))
+        if z is None:
+            todo.append((xt, yt))
+        else:
+            place(xt, yt, z)
+
+    if todo:
+        if vectorized is None:
+            vectorized = broadcasts(objfun, args, xs, ys)
+        if vectorized:
+            results = []
+            for xt, yt in todo:
+                X, Y = np.meshgrid(_points(xt), _points(yt), indexing='ij')
+                results.append(np.asarray(
+                    _value(objfun([X, Y], *args)), dtype=float))
+        else:
+            results = _scalar_tiles(objfun, args, todo, processes)
+        for (xt, yt), z in zip(todo, results):
+            place(xt, yt, z)
+            if cache is not None:
+                cache.put(TileCache.key(key, xt, yt), z)
+
+    X, Y = np.meshgrid(xs, ys, indexing='ij')
+    return X, Y, Z
+
+
+def _scalar_tiles(objfun, args, todo, processes):
+    if processes != 0:
+        try:
+            pickle.dumps((objfun, args))
+        except (pickle.PicklingError, AttributeError, TypeError):
+            processes = 0
+    if processes == 0:
+        return [_scalar_tile(objfun, args, _points(xt), _points(yt))
+                for xt, yt in todo]
+    with ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker,
+            initargs=(objfun, args),
+    ) as pool:
+        futures = [pool.submit(_worker_tile, _points(xt), _points(yt))
+                   for xt, yt in todo]
+        return [f.result() for f in futures]
@@ -0,0 +1,146 @@
+"""
+Array-backed recording of solver progress from monit callbacks.
+
+The examples keep their progress in Python objects: bnd_mcs_solve_ex.py
+creates a matplotlib Rectangle per monit call, handle_solve_dfls_ex.py a
+deepcopy of x and handle_solve_bounds_foas_ex.py a list.  A TraceRecorder
+is passed as monit instead and copies the values into preallocated NumPy
+arrays, one row per recorded call.  The arrays double in size when full,
+or, with ring=K, only the last K recorded calls are kept.  stride=k
+records every k-th call only.  The arrays can be saved to .npy files and
+loaded again for plotting.
+
+Example, with the problem of bnd_mcs_solve_ex.py:
+
+    trace = TraceRecorder(stride=10)
+    glopt.bnd_mcs_solve(objfun, ibound, bl, bu, comm, monit=trace.mcs)
+    t = trace.arrays()
+    boxes = [Rectangle(l, *(u - l)) for l, u in zip(t['boxl'], t['boxu'])]
+    trace.save('mcs_run')
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import glob
+
+import numpy as np
+
+
+class TraceRecorder:
+    """
+    Rows of monit values in growable arrays, or in a ring buffer.
+
+    handle() is a monit callback for the handle solvers
+    (opt.handle_solve_bounds_foas, handle_solve_dfls, handle_solve_bxnl,
+    ...) with the signature monit(x, rinfo, stats, data=None);
+    handle_inform() is the older form that also takes and returns inform,
+    and mcs() is the glopt.bnd_mcs_solve monit.  record() stores any other
+    named values.  nrinfo and nstats limit how many leading elements of
+    rinfo and stats are kept.
+    """
+    def __init__(self, capacity=1024, stride=1, ring=None, nrinfo=None,
+                 nstats=None):
+        if stride < 1:
+            raise ValueError('stride must be at least 1')
+        self.capacity = ring if ring else capacity
+        self.stride = stride
+        self.ring = ring
+        self.nrinfo = nrinfo
+        self.nstats = nstats
+        self.calls = 0
+        self.nrecorded = 0
+        self._data = {}
+
+    def __len__(self):
+        return min(self.nrecorded, self.capacity) if self.ring \
+            else self.nrecorded
+
+    def _due(self):
+        self.calls += 1
+        return (self.calls - 1) % self.stride == 0
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, a in self._data.items():
+            b = np.empty((self.capacity,) + a.shape[1:], dtype=a.dtype)
+            b[:self.nrecorded] = a[:self.nrecorded]
+            self._data[name] = b
+
+    def record(self, **values):
+        """
+        Store one row of values, ignoring stride (which the callbacks apply).
+
+        The call number is stored as 'call'.  Every later row must have
+        values of the same names and shapes as the first.
+        """
+        if not self.ring and self.nrecorded == self.capacity:
+            self._grow()
+        row = self.nrecorded % self.capacity if self.ring else self.nrecorded
+        values['call'] = self.calls
+        for name, value in values.items():
+            a = self._data.get(name)
+            if a is None:
+                value = np.asarray(value)
+                a = np.empty((self.capacity,) + value.shape,
+                             dtype=value.dtype if value.dtype.kind in 'biu'
+                             else np.float64)
+                self._data[name] = a
+            a[row] = value
+        self.nrecorded += 1
+
+    def handle(self, x, rinfo, stats, _data=None):
+        """
+        monit for the handle solvers.
+        """
+        if self._due():
+            self.record(x=x, rinfo=rinfo[:self.nrinfo],
+                        stats=stats[:self.nstats])
+
+    def handle_inform(self, x, inform, rinfo, stats, _data=None):
+        """
+        monit for the handle solvers in the form that returns inform.
+        """
+        self.handle(x, rinfo, stats)
+        return inform
+
+    def mcs(self, ncall, xbest, _icount, _inlist, _numpts, _initpt, _xbaskt,
+            boxl, boxu, nstate):
+        """
+        monit for glopt.bnd_mcs_solve: the best point and the current box.
+        """
+        if self._due():
+            self.record(ncall=ncall, xbest=xbest, boxl=boxl, boxu=boxu,
+                        nstate=nstate)
+
+    def arrays(self):
+        """
+        Return a dict of the recorded arrays, oldest row first.
+
+        Without ring these are views of the buffers, valid until the next
+        record.
+        """
+        n = len(self)
+        if self.ring and self.nrecorded > self.capacity:
+            start = self.nrecorded % self.capacity
+            order = np.r_[start:self.capacity, 0:start]
+            return {name: a[order] for name, a in self._data.items()}
+        return {name: a[:n] for name, a in self._data.items()}
+
+    def save(self, prefix):
+        """
+        Save every array to prefix_<name>.npy; return the paths.
+        """
+        paths = []
+        for name, a in self.arrays().items():
+            paths.append('{}_{}.npy'.format(prefix, name))
+            np.save(paths[-1], a)
+        return paths
+
+
+def load_trace(prefix, mmap_mode=None):
+    """
+    Load the arrays saved by TraceRecorder.save(prefix) into a dict.
+    """
+    trace = {}
+    for path in sorted(glob.glob(glob.escape(prefix) + '_*.npy')):
+        name = path[len(prefix) + 1:-len('.npy')]
+        trace[name] = np.load(path, mmap_mode=mmap_mode)
+    return trace
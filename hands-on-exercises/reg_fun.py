@@ -5,6 +5,26 @@ Support functions for regression exercises.
 import numpy as np
 from naginterfaces.library import rand
 
+def toeplitz_cov(m, sigma=2.0, rho=0.5):
+    """
+    Covariance matrix with entries sigma**2 * rho**abs(i-j).
+    """
+    lag = np.abs(np.subtract.outer(np.arange(m), np.arange(m)))
+    return (sigma ** 2) * rho ** lag
+
+def _multivar_sample(dist_id, mode, n, xmu, c, comm, statecomm):
+    """
+    Call the NAG multivariate sampler for dist_id.
+    """
+    if dist_id == "MN":
+        sorder = 1
+        return rand.multivar_normal(sorder, mode, n, xmu, c, comm, statecomm)
+    if dist_id == "T3":
+        df = 3
+        c_t = (float(df) - 2) / float(df) * c
+        return rand.multivar_students_t(mode, n, df, xmu, c_t, comm, statecomm)
+    raise ValueError('unknown dist_id ' + repr(dist_id))
+
 def gen_multivar_x(m, n, statecomm, dist_id="MN", sigma=2.0, rho=0.5):
     """
     Generate independent variables.
@@ -17,25 +37,38 @@ def gen_multivar_x(m, n, statecomm, dist_id="MN", sigma=2.0, rho=0.5):
     """
     n = int(n)
     xmu = np.ones(m)
-    c = np.zeros((m, m))
-    for i in range(m):
-        for j in range(m):
-            c[i, j] = (sigma ** 2) * rho ** abs(i-j)
+    c = toeplitz_cov(m, sigma, rho)
 
     # NAG arguments for multivar_XXX functions
     mode = 2
     comm = {}
 
     # call random sampling
-    if dist_id == "MN":
-        sorder = 1
-        x = rand.multivar_normal(sorder, mode, n, xmu, c, comm, statecomm)
-    if dist_id == "T3":
-        df = 3
-        c_t = (float(df) - 2) / float(df) * c
-        x = rand.multivar_students_t(mode, n, df, xmu, c_t, comm, statecomm)
+    return _multivar_sample(dist_id, mode, n, xmu, c, comm, statecomm)
+
+def gen_multivar_x_chunks(m, n, statecomm, chunk_size=100000, dist_id="MN",
+                          sigma=2.0, rho=0.5):
+    """
+    Generate independent variables in chunks of at most chunk_size rows.
+
+    Takes the same arguments as gen_multivar_x and yields arrays of shape
+    (rows, m) until n rows have been produced, so only one chunk is held in
+    memory at a time.  The reference vector (the factorized covariance
+    matrix) is set up once and every chunk is drawn from statecomm, so a
+    given seed and chunk_size always give the same sequence of rows.
+    """
+    n = int(n)
+    xmu = np.ones(m)
+    c = toeplitz_cov(m, sigma, rho)
+    comm = {}
 
-    return x
+    # mode 0 sets up the reference vector in comm, mode 1 samples from it
+    _multivar_sample(dist_id, 0, 1, xmu, c, comm, statecomm)
+    done = 0
+    while done < n:
+        rows = min(chunk_size, n - done)
+        yield _multivar_sample(dist_id, 1, rows, xmu, c, comm, statecomm)
+        done += rows
 
 def gen_obs(x, statecomm):
     """
@@ -43,15 +76,14 @@ def gen_obs(x, statecomm):
     """
     m = x.shape[1]
     n = x.shape[0]
-    x = np.matrix(x)
 
     # set regression coefficients
-    beta = np.matrix(np.ones((m, 1)))
+    beta = np.ones(m)
 
     # sample observation noise
-    epsilon = np.matrix(rand.dist_normal(n, 0.0, 9.0, statecomm)).reshape(n, 1)
+    epsilon = rand.dist_normal(n, 0.0, 9.0, statecomm)
 
     # define synthetic observations
-    y = x * beta + epsilon
+    y = x @ beta + epsilon
 
-    return np.squeeze(np.asarray(y))
+    return y
@@ -0,0 +1,248 @@
+"""
+Autotuned choice between dgesv and the mixed precision dsgesv.
+
+dsgesv factorizes in single precision and recovers double precision accuracy
+by iterative refinement.  For large systems that is faster than dgesv, but
+the size at which it starts to win depends on the host, and refinement only
+converges when A is not too badly conditioned.  tune() measures both on this
+host with the solver_bench harness, finds the crossover size and the largest
+condition number for which refinement converged, and saves them to a local
+profile file.  solve() then uses dsgesv for the systems where the profile
+says it pays off.
+
+Example, from this directory:
+
+    python autotune_solve.py            # once per host
+    from autotune_solve import solve
+    x = solve(A, b)
+
+The profile is read from and written to $NAG_SOLVER_PROFILE, or
+~/.nag_solver_profile.json when that is not set.
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import collections
+import json
+import os
+import platform
+import time
+
+import numpy as np
+from naginterfaces.library.lapacklin import dgesv
+from naginterfaces.library.lapacklin import dsgesv
+from naginterfaces.base import utils
+
+from solver_bench import bench_variant
+
+DEFAULT_SIZES = (100, 200, 500, 1000, 2000, 4000)
+DEFAULT_CONDS = tuple(10.0**np.arange(2, 14))
+
+
+def profile_path():
+    """
+    Return the location of this host's profile file.
+    """
+    return os.environ.get(
+        'NAG_SOLVER_PROFILE',
+        os.path.join(os.path.expanduser('~'), '.nag_solver_profile.json'),
+    )
+
+
+def conditioned_matrix(n, cond, seed=2):
+    """
+    Return a random n by n matrix, in Fortran order, with condition number cond.
+    """
+    rng = np.random.RandomState(seed)
+    u, _ = np.linalg.qr(rng.standard_normal((n, n)))
+    v, _ = np.linalg.qr(rng.standard_normal((n, n)))
+    s = np.logspace(0.0, -np.log10(cond), n)
+    return np.asfortranarray((u * s) @ v.T)
+
+
+def find_crossover(timings):
+    """
+    The smallest size from which dsgesv was faster at every larger size.
+
+    timings is a list of (n, dgesv time, dsgesv time) sorted by n.  Returns
+    None when dsgesv was not faster at the largest size.
+    """
+    crossover = None
+    for n, t_d, t_s in reversed(timings):
+        if t_s >= t_d:
+            break
+        crossover = n
+    return crossover
+
+
+def find_cond_limit(n=500, conds=DEFAULT_CONDS, seed=2):
+    """
+    The largest condition number up to which dsgesv refinement converged.
+
+    Returns 0.0 if it did not converge for the smallest condition number.
+    """
+    b = np.ones((n, 1))
+    limit = 0.0
+    for cond in sorted(conds):
+        try:
+            itera = dsgesv(conditioned_matrix(n, cond, seed), b)[3]
+        except utils.NagException:
+            break
+        if itera < 0:
+            break
+        limit = float(cond)
+    return limit
+
+
+def tune(sizes=DEFAULT_SIZES, cond_n=500, conds=DEFAULT_CONDS, repeat=5,
+         path=None, verbose=False):
+    """
+    Measure dgesv against dsgesv on this host and save the profile.
+
+    Returns the profile dict.
+    """
+    timings = []
+    for n in sorted(sizes):
+        t_d = bench_variant('nag_dgesv', n, order='F', repeat=repeat)['median']
+        t_s = bench_variant('nag_dsgesv', n, order='F', repeat=repeat)['median']
+        if verbose:
+            print('n={:<6d} dgesv={:.3e}s dsgesv={:.3e}s'.format(n, t_d, t_s))
+        timings.append((int(n), t_d, t_s))
+
+    profile = {
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'timings': timings,
+        'crossover': find_crossover(timings),
+        'cond_n': cond_n,
+        'cond_limit': find_cond_limit(cond_n, conds),
+    }
+    if verbose:
+        print('crossover={crossover} cond_limit={cond_limit:.1e}'.format(
+            **profile))
+    save_profile(profile, path)
+    return profile
+
+
+def save_profile(profile, path=None):
+    """
+    Write profile to path, by default profile_path().
+    """
+    with open(path or profile_path(), 'w') as f:
+        json.dump(profile, f, indent=1)
+
+
+def load_profile(path=None):
+    """
+    Read a profile written by tune(), or return None if there is none.
+    """
+    try:
+        with open(path or profile_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class MixedPrecisionSolver:
+    """
+    Solve A x = b with dsgesv where the profile says it is faster.
+
+    dsgesv is used when n is at least the profile's crossover and, if the
+    caller gives a cond_hint, the hint does not exceed the profile's
+    cond_limit.  When refinement does not converge (itera < 0) dsgesv has
+    already redone the solve with a double precision factorization, so
+    its solution is returned and the failure is counted; if dsgesv raises
+    an error the system is solved again with dgesv.  Without a profile
+    every system goes to dgesv.
+
+    cond_limit can only be applied to systems that come with a cond_hint.
+    For the others the outcomes of the last window dsgesv solves are kept
+    per size band (the sizes with the same number of bits), and while more
+    than max_failure_rate of them failed to refine the band goes to dgesv,
+    except for every probe_every-th system, which still tries dsgesv so
+    that the band is used again once its matrices are better conditioned.
+    """
+    def __init__(self, profile=None, window=20, max_failure_rate=0.25,
+                 probe_every=10):
+        self.profile = profile
+        self.window = window
+        self.max_failure_rate = max_failure_rate
+        self.probe_every = probe_every
+        self.counts = {
+            'dgesv': 0, 'dsgesv': 0, 'refinement_failed': 0, 'fallback': 0,
+        }
+        self.band_history = {}
+        self._band_skipped = collections.Counter()
+
+    @staticmethod
+    def band(n):
+        """
+        The size band of n: sizes from 2**(band - 1) to 2**band - 1.
+        """
+        return int(n).bit_length()
+
+    def failure_rate(self, n):
+        """
+        The refinement failure rate of recent dsgesv solves in n's band.
+
+        Only solves without a cond_hint count, and the rate is 0.0 until
+        window // 2 of them have been seen.
+        """
+        history = self.band_history.get(self.band(n), ())
+        if len(history) < max(1, self.window // 2):
+            return 0.0
+        return sum(history) / len(history)
+
+    def use_mixed(self, n, cond_hint=None):
+        """
+        Whether a system of size n (and condition cond_hint) goes to dsgesv.
+        """
+        if not self.profile or self.profile.get('crossover') is None:
+            return False
+        if n < self.profile['crossover']:
+            return False
+        if cond_hint is not None:
+            return cond_hint <= self.profile['cond_limit']
+        if self.failure_rate(n) <= self.max_failure_rate:
+            return True
+        band = self.band(n)
+        self._band_skipped[band] += 1
+        return self._band_skipped[band] % self.probe_every == 0
+
+    def solve(self, A, b, cond_hint=None):
+        """
+        Return the solution x of A x = b.
+        """
+        n = np.shape(A)[0]
+        if self.use_mixed(n, cond_hint):
+            try:
+                _, _, x, itera = dsgesv(A, b)
+            except utils.NagException:
+                self.counts['fallback'] += 1
+            else:
+                self.counts['dsgesv'] += 1
+                if itera < 0:
+                    self.counts['refinement_failed'] += 1
+                if cond_hint is None:
+                    self.band_history.setdefault(
+                        self.band(n), collections.deque(maxlen=self.window),
+                    ).append(itera < 0)
+                return x
+        self.counts['dgesv'] += 1
+        return dgesv(A, b)[2]
+
+
+_default_solver = None
+
+
+def solve(A, b, cond_hint=None):
+    """
+    Solve A x = b with the profile of this host, loaded on first use.
+    """
+    global _default_solver  # pylint: disable=global-statement
+    if _default_solver is None:
+        _default_solver = MixedPrecisionSolver(load_profile())
+    return _default_solver.solve(A, b, cond_hint)
+
+
+if __name__ == '__main__':
+    tune(verbose=True)
@@ -0,0 +1,188 @@
+"""
+Batched solver for stacks of small dense linear systems.
+
+Calling lapacklin.dgesv(A, b) once per system in a Python loop is dominated
+by the wrapper overhead when the systems are small (see the small-N rows of
+compare_solvers).  BatchedDgesv owns Fortran-ordered work buffers for a
+whole stack of k systems and loops over the base or _primitive dgesv; the
+_primitive path moves one set of ctypes pointers along the buffers by their
+strides, so nothing is allocated per system.  Singular systems do not stop
+the batch: the LAPACK info value of every system is returned so the
+failures can be handled afterwards.
+
+Example:
+
+    A = np.random.rand(10000, 8, 8)
+    b = np.random.rand(10000, 8, 1)
+    res = solve_batched(A, b)
+    res.x[res.failed]   # the solutions of singular systems are not valid
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-instance-attributes
+import collections
+import ctypes
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from naginterfaces._primitive.lapacklin import dgesv as dgesv_primitive
+from naginterfaces.base.lapacklin import dgesv as dgesv_base
+from naginterfaces.base import utils
+
+BatchResult = collections.namedtuple('BatchResult', ['x', 'info', 'failed'])
+BatchResult.__doc__ = """
+Result of a batched solve.
+
+x      -- (k, n, nrhs) solutions
+info   -- (k,) LAPACK info of each system: 0 on success, i > 0 when U(i,i)
+          is exactly zero so the system is singular, < 0 for an illegal
+          argument
+failed -- indices of the systems with info != 0
+"""
+
+
+def _cursor(arr, start, ptype):
+    # A ctypes pointer to arr[start] and a c_void_p view of its address
+    ptr = arr[start:].ctypes.data_as(ptype)
+    return ptr, ctypes.c_void_p.from_buffer(ptr)
+
+
+class BatchedDgesv:
+    """
+    Solve k systems A[i] x[i] = b[i] of size n with nrhs right-hand sides.
+
+    path is 'primitive' (the default, lowest overhead) or 'base'.  threads
+    greater than one splits the stack into chunks solved on a thread pool;
+    the _primitive calls release the GIL, but if the NAG engine is itself
+    multithreaded its thread count should be reduced to avoid
+    oversubscribing the cores.
+
+    The buffers are reused by every call to solve(), so the x array of a
+    result is only valid until the next call.
+    """
+    def __init__(self, k, n, nrhs=1, path='primitive', threads=1, chunk=None):
+        if path not in ('primitive', 'base'):
+            raise ValueError("path must be 'primitive' or 'base'")
+        self.k, self.n, self.nrhs = k, n, nrhs
+        self.path = path
+        self.threads = max(1, int(threads))
+        if chunk is None:
+            chunk = -(-k // self.threads)
+        self.chunk = max(1, int(chunk))
+
+        # a[i] and b[i] hold the transposes of A[i] and b[i] in C order,
+        # which is A[i] and b[i] in the Fortran order the engine expects.
+        self.a = np.empty((k, n, n))
+        self.b = np.empty((k, nrhs, n))
+        self.ipiv = np.zeros((k, n), dtype=utils.EngineIntCType)
+        self.info = np.zeros(k, dtype=utils.EngineIntCType)
+
+        if path == 'primitive':
+            self._n_c = utils.EngineIntCType(n)
+            self._nrhs_c = utils.EngineIntCType(nrhs)
+
+    def _solve_range(self, start, stop):
+        if self.path == 'primitive':
+            self._solve_range_primitive(start, stop)
+            return
+        a, ipiv, b, info = self.a, self.ipiv, self.b, self.info
+        n, nrhs = self.n, self.nrhs
+        for i in range(start, stop):
+            try:
+                dgesv_base(n, nrhs, a[i].T, ipiv[i], b[i].T)
+            except utils.NagException as exc:
+                info[i] = exc.errno if exc.errno else -1
+
+    def _solve_range_primitive(self, start, stop):
+        # One pointer per argument for the whole range, moved from system
+        # to system by overwriting the address it holds
+        double_p = ctypes.POINTER(ctypes.c_double)
+        int_p = ctypes.POINTER(utils.EngineIntCType)
+        a_p, a_addr = _cursor(self.a, start, double_p)
+        ipiv_p, ipiv_addr = _cursor(self.ipiv, start, int_p)
+        b_p, b_addr = _cursor(self.b, start, double_p)
+        info_p, info_addr = _cursor(self.info, start, int_p)
+        a0, ipiv0, b0, info0 = (
+            a_addr.value, ipiv_addr.value, b_addr.value, info_addr.value)
+        a_step, ipiv_step, b_step, info_step = (
+            self.a.strides[0], self.ipiv.strides[0], self.b.strides[0],
+            self.info.strides[0])
+        n_c, nrhs_c = self._n_c, self._nrhs_c
+        for i in range(stop - start):
+            a_addr.value = a0 + i * a_step
+            ipiv_addr.value = ipiv0 + i * ipiv_step
+            b_addr.value = b0 + i * b_step
+            info_addr.value = info0 + i * info_step
+            dgesv_primitive(n_c, nrhs_c, a_p, n_c, ipiv_p, b_p, n_c, info_p)
+
+    def solve(self, A, b):
+        """
+        Solve the stack A (k, n, n) with right-hand sides b (k, n, nrhs).
+
+        b may also be given as (k, n) when nrhs is 1.
+        """
+        A = np.asarray(A, dtype=float)
+        b = np.asarray(b, dtype=float)
+        if b.ndim == 2:
+            b = b[:, :, np.newaxis]
+        if A.shape != (self.k, self.n, self.n):
+            raise ValueError(
+                'A must have shape {}'.format((self.k, self.n, self.n)))
+        if b.shape != (self.k, self.n, self.nrhs):
+            raise ValueError(
+                'b must have shape {}'.format((self.k, self.n, self.nrhs)))
+
+        np.copyto(self.a, A.transpose(0, 2, 1))
+        np.copyto(self.b, b.transpose(0, 2, 1))
+        self.info[:] = 0
+
+        bounds = [
+            (start, min(start + self.chunk, self.k))
+            for start in range(0, self.k, self.chunk)
+        ]
+        # The base dgesv reports a singular system (info > 0) with a
+        # NagAlgorithmicWarning, which is raised here so that _solve_range
+        # can record it.  The filter is process-wide, so it also covers the
+        # pool threads.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', utils.NagAlgorithmicWarning)
+            if self.threads == 1 or len(bounds) == 1:
+                for start, stop in bounds:
+                    self._solve_range(start, stop)
+            else:
+                with ThreadPoolExecutor(max_workers=self.threads) as pool:
+                    for future in [
+                            pool.submit(self._solve_range, start, stop)
+                            for start, stop in bounds
+                    ]:
+                        future.result()
+
+        return BatchResult(
+            self.b.transpose(0, 2, 1), self.info,
+            np.flatnonzero(self.info),
+        )
+
+
+def solve_batched(A, b, path='primitive', threads=1, chunk=None):
+    """
+    Solve the stack of systems A (k, n, n) x = b (k, n, nrhs) in one call.
+
+    Returns a BatchResult whose arrays are not shared with any later solve.
+    Use BatchedDgesv directly to reuse the buffers across batches of the
+    same shape.
+
+    A singular system is reported in failed on either path:
+
+    >>> A = np.stack([np.eye(3), np.zeros((3, 3))])
+    >>> b = np.ones((2, 3, 1))
+    >>> for path in ('primitive', 'base'):
+    ...     res = solve_batched(A, b, path=path)
+    ...     print(path, res.failed, res.info)
+    primitive [1] [0 1]
+    base [1] [0 1]
+    """
+    A = np.asarray(A, dtype=float)
+    b = np.asarray(b, dtype=float)
+    k, n = A.shape[0], A.shape[1]
+    nrhs = 1 if b.ndim == 2 else b.shape[2]
+    res = BatchedDgesv(k, n, nrhs, path, threads, chunk).solve(A, b)
+    return BatchResult(res.x.copy(), res.info.copy(), res.failed)
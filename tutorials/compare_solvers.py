@@ -5,17 +5,52 @@ import timeit
 import ctypes
 
 def call_dgesv_primitive(A,b,N,ipiv,info):
+    nrhs = b.shape[1] if b.ndim == 2 else 1
     N_c = utils.EngineIntCType(N)
-    one_c = utils.EngineIntCType(1)
+    nrhs_c = utils.EngineIntCType(nrhs)
     A_c = A.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
     ipiv_c = ipiv.ctypes.data_as(ctypes.POINTER(utils.EngineIntCType))
     b_c = b.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
 
-    dgesv_primitive(N_c, one_c ,A_c ,N_c ,ipiv_c, b_c, N_c,info)
+    dgesv_primitive(N_c, nrhs_c ,A_c ,N_c ,ipiv_c, b_c, N_c,info)
 
-    r = np.ctypeslib.as_array(b_c,(N,1))
+    #b is overwritten column by column, so view it as (nrhs,N) and transpose
+    r = np.ctypeslib.as_array(b_c,(nrhs,N)).T
     return r
 
+class DgesvContext:
+    """Reusable buffers and ctypes arguments for the _primitive dgesv
+
+    call_dgesv_primitive creates the integer arguments and pointers on every
+    call.  A context creates them once for its own Fortran-ordered A, b and
+    ipiv arrays, so that solve_inplace() only calls the engine.  Copy a new
+    problem in with load(), or write into ctx.A and ctx.b directly.
+    """
+    def __init__(self,N,nrhs=1):
+        self.N = N
+        self.nrhs = nrhs
+        self.A = np.zeros((N,N),order='F')
+        self.b = np.zeros((N,nrhs),order='F')
+        self.ipiv = np.zeros(N,dtype=utils.EngineIntCType)
+        self.info = utils.EngineIntCType(0)
+
+        N_c = utils.EngineIntCType(N)
+        nrhs_c = utils.EngineIntCType(nrhs)
+        A_c = self.A.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+        ipiv_c = self.ipiv.ctypes.data_as(ctypes.POINTER(utils.EngineIntCType))
+        b_c = self.b.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+        self._args = (N_c, nrhs_c, A_c, N_c, ipiv_c, b_c, N_c, self.info)
+
+    def load(self,A,b):
+        """Copy A and b into the context's buffers"""
+        np.copyto(self.A,A)
+        np.copyto(self.b,np.reshape(b,(self.N,self.nrhs)))
+
+    def solve_inplace(self):
+        """Overwrite A with its LU factors and b with the solution; return info"""
+        dgesv_primitive(*self._args)
+        return self.info.value
+
 def compare_solvers(N,number=5,res_form='raw',verbose=False,fortran_order=False):
     if verbose:
         print(N)
@@ -92,3 +127,29 @@ def compare_solvers(N,number=5,res_form='raw',verbose=False,fortran_order=False)
         result[1:] = result[1:] / (scipy/number)
 
     return result
+
+def compare_call_overhead(N=4,number=10000,res_form='raw'):
+    """Time one dgesv call through each interface for a small N
+
+    For small systems the time per call is dominated by the Python work done
+    around the solve, so comparing the library, base, primitive and context
+    paths shows the overhead each layer adds.  The base, primitive and
+    context paths overwrite A and b, so, as in solver_bench, the system is
+    copied back in before every call, outside the timed region.
+    """
+    #solver_bench imports this module, so import it here
+    from solver_bench import make_problem, _bind, _time_calls
+
+    A,b = make_problem(N,order='F')
+    variants = ('nag_dgesv','nag_dgesv_base','nag_dgesv_primitive','nag_dgesv_context')
+    times = [_time_calls(*_bind(variant,A,b),number) for variant in variants]
+
+    #Return the average time per call for each interface
+    result = np.array([N]+times)
+
+    #Scale so that the context path is 1; a result of 5 means that interface
+    #took five times as long per call as the context path
+    if res_form=='scaled':
+        result[1:] = result[1:] / times[-1]
+
+    return result
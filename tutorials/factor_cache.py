@@ -0,0 +1,177 @@
+"""
+Reusable factorizations for repeated solves with the same matrix.
+
+lapacklin.dgesv(A, b), or dpotrf followed by dpotrs, factorizes A again on
+every call even when only the right-hand side changes.  A Factorization
+factorizes A once through the base interface, keeps the Fortran-ordered
+factors and pivots, and solves later right-hand sides from them in O(N^2)
+instead of O(N^3).  FactorCache keeps recently used factorizations keyed by
+the contents of the matrix, or by an explicit name and version, and evicts
+the least recently used ones when a byte budget is exceeded.
+
+Example:
+
+    cache = FactorCache(max_bytes=2**30)
+    for b in right_hand_sides:
+        x = cache.solve(A, b, kind='cholesky')
+    cache.stats()   # one miss, then hits
+"""
+# pylint: disable=invalid-name,too-many-arguments
+import collections
+import hashlib
+
+import numpy as np
+from naginterfaces.base.lapacklin import dgetrf, dgetrs
+from naginterfaces.base.lapacklin import dpotrf, dpotrs
+from naginterfaces.base.lapacklin import dsgesv as dsgesv_base
+from naginterfaces.base import utils
+
+KINDS = ('lu', 'cholesky', 'mixed')
+
+
+class Factorization:
+    """
+    A square matrix factorized once for many solves.
+
+    kind is 'lu' (dgetrf/dgetrs), 'cholesky' (dpotrf/dpotrs, A symmetric
+    positive definite, only the uplo triangle is referenced) or 'mixed'.
+
+    dsgesv does not return the single precision factors it computes, so a
+    'mixed' factorization keeps a Fortran-ordered copy of A and calls dsgesv
+    for every solve.  As soon as one of those solves needs double precision
+    (itera < 0) dsgesv leaves the double precision LU factors in the copy,
+    and the factorization carries on as an 'lu' one.
+    """
+    def __init__(self, a, kind='lu', uplo='L'):
+        if kind not in KINDS:
+            raise ValueError('kind must be one of {}'.format(KINDS))
+        a = np.array(a, dtype=float, order='F')
+        if a.ndim != 2 or a.shape[0] != a.shape[1]:
+            raise ValueError('a must be a square matrix')
+        self.n = a.shape[0]
+        self.kind = kind
+        self.uplo = uplo
+        self.a = a
+        self.ipiv = np.zeros(self.n, dtype=utils.EngineIntCType)
+        self.nsolves = 0
+        if kind == 'lu':
+            dgetrf(self.n, self.n, self.a, self.ipiv)
+        elif kind == 'cholesky':
+            dpotrf(uplo, self.n, self.a)
+
+    @property
+    def nbytes(self):
+        """
+        The memory held by the factors and pivots.
+        """
+        return self.a.nbytes + self.ipiv.nbytes
+
+    def solve(self, b):
+        """
+        Return the solution of A x = b; b is (n,) or (n, nrhs).
+        """
+        b = np.asarray(b, dtype=float)
+        vector = b.ndim == 1
+        x = np.array(b.reshape(self.n, -1), order='F')
+        nrhs = x.shape[1]
+        if self.kind == 'lu':
+            dgetrs('N', self.n, nrhs, self.a, self.ipiv, x)
+        elif self.kind == 'cholesky':
+            dpotrs(self.uplo, self.n, nrhs, self.a, x)
+        else:
+            rhs = x
+            x = np.zeros_like(rhs, order='F')
+            itera = dsgesv_base(self.n, nrhs, self.a, self.ipiv, rhs, x)
+            if itera is not None and itera < 0:
+                self.kind = 'lu'
+        self.nsolves += 1
+        return x[:, 0] if vector else x
+
+
+class FactorCache:
+    """
+    An LRU cache of Factorizations bounded by max_bytes.
+
+    Without a key, matrices are identified by a hash of their contents,
+    which costs O(N^2) per lookup.  With key (and optionally version) the
+    contents are not looked at: a new version of a key replaces the cached
+    factorization of the old one.
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def content_key(a):
+        """
+        A digest of the shape and values of a, independent of its order.
+        """
+        a = np.ascontiguousarray(a, dtype=float)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr(a.shape).encode())
+        h.update(a.data)
+        return h.hexdigest()
+
+    def get(self, a, kind='lu', uplo='L', key=None, version=None):
+        """
+        Return the Factorization of a, computing it on a miss.
+        """
+        if key is None:
+            key, version = self.content_key(a), None
+        entry_key = (key, kind, uplo if kind == 'cholesky' else None)
+        entry = self._entries.get(entry_key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        if entry is not None:
+            self._remove(entry_key)
+        fact = Factorization(a, kind, uplo)
+        if fact.nbytes <= self.max_bytes:
+            while self._entries and self.nbytes + fact.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[entry_key] = (version, fact)
+            self.nbytes += fact.nbytes
+        return fact
+
+    def solve(self, a, b, kind='lu', uplo='L', key=None, version=None):
+        """
+        Solve a x = b using the cached factorization of a.
+        """
+        return self.get(a, kind, uplo, key, version).solve(b)
+
+    def _remove(self, entry_key):
+        _, fact = self._entries.pop(entry_key)
+        self.nbytes -= fact.nbytes
+
+    def clear(self):
+        """
+        Drop every cached factorization; the counters are kept.
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Return the cache counters as a dict.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,340 @@
+"""
+Benchmark harness for the dense linear solvers compared in compare_solvers.
+
+compare_solvers() times each variant once for a single problem size.  The
+functions here sweep over the matrix size N, the number of right-hand sides
+and the storage order of the inputs, run warmup calls, repeat every
+measurement several times and summarize the trials with the median,
+inter-quartile range and minimum.  Results can be written to JSON or CSV and
+compared against a stored baseline run so that a slowdown in any of the
+variants is reported as an error.
+
+Example, from this directory:
+
+    python solver_bench.py --sizes 10 100 1000 --nrhs 1 8 --json today.json
+    python solver_bench.py --sizes 10 100 1000 --nrhs 1 8 --baseline today.json
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import argparse
+import csv
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import scipy.linalg
+from naginterfaces.library.lapacklin import dgesv
+from naginterfaces.library.lapacklin import dsgesv
+from naginterfaces.base.lapacklin import dgesv as dgesv_base
+from naginterfaces.base.lapacklin import dsgesv as dsgesv_base
+from naginterfaces.base import utils
+
+from compare_solvers import call_dgesv_primitive, DgesvContext
+
+# The variants of compare_solvers, plus the reusable DgesvContext path
+VARIANTS = (
+    'scipy',
+    'nag_dgesv',
+    'nag_dgesv_base',
+    'nag_dgesv_primitive',
+    'nag_dgesv_context',
+    'nag_dsgesv',
+    'nag_dsgesv_base',
+)
+
+# The fields of one benchmark record, in CSV column order
+FIELDS = (
+    'variant', 'n', 'nrhs', 'order', 'number', 'repeat',
+    'median', 'iqr', 'min', 'mean',
+)
+
+
+class BenchmarkRegression(Exception):
+    """
+    Raised when a benchmark run is slower than its stored baseline.
+    """
+    def __init__(self, regressions):
+        self.regressions = regressions
+        lines = [
+            '{variant} n={n} nrhs={nrhs} order={order}: '
+            '{current:.3e}s vs baseline {baseline:.3e}s ({ratio:.2f}x)'.format(
+                **r)
+            for r in regressions
+        ]
+        super().__init__(
+            '{} benchmark(s) slower than baseline:\n  '.format(
+                len(regressions)) + '\n  '.join(lines)
+        )
+
+
+def make_problem(n, nrhs=1, order='C', seed=2):
+    """
+    Return a random system (A, b) of size n with nrhs right-hand sides.
+
+    order is 'C' or 'F' and applies to both A and b.
+    """
+    np.random.seed(seed)
+    A = np.random.rand(n, n)
+    b = np.random.rand(n, nrhs)
+    if order == 'F':
+        A = np.asfortranarray(A)
+        b = np.asfortranarray(b)
+    return A, b
+
+
+def _bind(variant, A, b):
+    """
+    Return (reset, call) for one variant solving the system (A, b).
+
+    The base and primitive variants overwrite their inputs, so they work on
+    copies that reset() restores before every timed call.  reset is None
+    for the variants that leave their inputs alone.
+    """
+    n, nrhs = b.shape
+    if variant == 'scipy':
+        return None, lambda: scipy.linalg.solve(A, b)
+    if variant == 'nag_dgesv':
+        return None, lambda: dgesv(A, b)
+    if variant == 'nag_dsgesv':
+        return None, lambda: dsgesv(A, b)
+
+    A_w = A.copy(order='K')
+    b_w = b.copy(order='K')
+    ipiv = np.zeros(n, dtype=utils.EngineIntCType)
+
+    def reset():
+        np.copyto(A_w, A)
+        np.copyto(b_w, b)
+
+    if variant == 'nag_dgesv_base':
+        return reset, lambda: dgesv_base(n, nrhs, A_w, ipiv, b_w)
+    if variant == 'nag_dgesv_primitive':
+        info = utils.EngineIntCType(0)
+        return reset, lambda: call_dgesv_primitive(A_w, b_w, n, ipiv, info)
+    if variant == 'nag_dgesv_context':
+        ctx = DgesvContext(n, nrhs)
+        return lambda: ctx.load(A, b), ctx.solve_inplace
+    if variant == 'nag_dsgesv_base':
+        x = np.zeros((n, nrhs), order='F')
+        return reset, lambda: dsgesv_base(n, nrhs, A_w, ipiv, b_w, x)
+    raise ValueError('unknown variant {!r}'.format(variant))
+
+
+def _time_calls(reset, call, number):
+    """
+    Return the mean time of number calls, excluding the resets.
+    """
+    elapsed = 0.0
+    for _ in range(number):
+        if reset is not None:
+            reset()
+        t0 = time.perf_counter()
+        call()
+        elapsed += time.perf_counter() - t0
+    return elapsed / number
+
+
+def _autonumber(reset, call, min_time=0.02, max_number=1000):
+    """
+    Choose how many calls make up one trial so it lasts at least min_time.
+    """
+    once = _time_calls(reset, call, 1)
+    if once <= 0.0:
+        return max_number
+    return int(min(max_number, max(1, np.ceil(min_time / once))))
+
+
+def summarize(trials):
+    """
+    Return the median, inter-quartile range, minimum and mean of trials.
+    """
+    trials = np.asarray(trials, dtype=float)
+    q25, median, q75 = np.percentile(trials, [25, 50, 75])
+    return {
+        'median': float(median),
+        'iqr': float(q75 - q25),
+        'min': float(trials.min()),
+        'mean': float(trials.mean()),
+    }
+
+
+def bench_variant(variant, n, nrhs=1, order='C', warmup=1, repeat=7,
+                  number=None, seed=2):
+    """
+    Benchmark one variant on one problem and return a record dict.
+
+    Times are seconds per solve.  When number is None the number of calls
+    per trial is chosen so that each trial takes at least 20ms.
+    """
+    A, b = make_problem(n, nrhs, order, seed)
+    reset, call = _bind(variant, A, b)
+    if warmup:
+        _time_calls(reset, call, warmup)
+    if number is None:
+        number = _autonumber(reset, call)
+    trials = [_time_calls(reset, call, number) for _ in range(repeat)]
+
+    record = {
+        'variant': variant, 'n': int(n), 'nrhs': int(nrhs), 'order': order,
+        'number': int(number), 'repeat': int(repeat),
+    }
+    record.update(summarize(trials))
+    return record
+
+
+def run_sweep(sizes, nrhs=(1,), orders=('C', 'F'), variants=VARIANTS,
+              warmup=1, repeat=7, number=None, verbose=False):
+    """
+    Benchmark every combination of variant, size, nrhs and order.
+
+    Returns a list of record dicts with the keys in FIELDS.
+    """
+    records = []
+    for n in sizes:
+        for k in nrhs:
+            for order in orders:
+                for variant in variants:
+                    record = bench_variant(
+                        variant, n, k, order, warmup=warmup, repeat=repeat,
+                        number=number,
+                    )
+                    if verbose:
+                        print(
+                            '{variant:20s} n={n:<6d} nrhs={nrhs:<4d} '
+                            'order={order} median={median:.3e} '
+                            'iqr={iqr:.2e} min={min:.3e}'.format(**record)
+                        )
+                    records.append(record)
+    return records
+
+
+def _environment():
+    """
+    Describe the host and package versions for the JSON output.
+    """
+    try:
+        from naginterfaces import __version__ as nag_version
+    except ImportError:
+        nag_version = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'naginterfaces': nag_version,
+    }
+
+
+def write_json(records, path):
+    """
+    Write records, with a description of the host, to a JSON file.
+    """
+    with open(path, 'w') as f:
+        json.dump(
+            {'environment': _environment(), 'records': records}, f, indent=1,
+        )
+
+
+def write_csv(records, path):
+    """
+    Write records to a CSV file with one row per record.
+    """
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({k: record[k] for k in FIELDS})
+
+
+def load_records(path):
+    """
+    Read the records back from a file written by write_json.
+    """
+    with open(path) as f:
+        return json.load(f)['records']
+
+
+def _key(record):
+    return (record['variant'], record['n'], record['nrhs'], record['order'])
+
+
+def compare_to_baseline(records, baseline, tolerance=0.25, stat='median'):
+    """
+    Return the records whose stat is more than tolerance slower than baseline.
+
+    Each entry is a dict giving the variant, n, nrhs and order, the current
+    and baseline times and their ratio.  Records with no matching baseline
+    entry are ignored.
+    """
+    reference = {_key(r): r for r in baseline}
+    regressions = []
+    for record in records:
+        base = reference.get(_key(record))
+        if base is None or base[stat] <= 0.0:
+            continue
+        ratio = record[stat] / base[stat]
+        if ratio > 1.0 + tolerance:
+            regressions.append({
+                'variant': record['variant'], 'n': record['n'],
+                'nrhs': record['nrhs'], 'order': record['order'],
+                'current': record[stat], 'baseline': base[stat],
+                'ratio': ratio,
+            })
+    return regressions
+
+
+def check_baseline(records, baseline, tolerance=0.25, stat='median'):
+    """
+    Raise BenchmarkRegression if any record is slower than its baseline.
+    """
+    regressions = compare_to_baseline(records, baseline, tolerance, stat)
+    if regressions:
+        raise BenchmarkRegression(regressions)
+
+
+def main(argv=None):
+    """
+    Command line entry point; returns the process exit status.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--nrhs', type=int, nargs='+', default=[1])
+    parser.add_argument('--orders', nargs='+', choices=['C', 'F'],
+                        default=['C', 'F'])
+    parser.add_argument('--variants', nargs='+', choices=VARIANTS,
+                        default=list(VARIANTS))
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--number', type=int, default=None)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--csv', help='write the results to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown against the baseline')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    records = run_sweep(
+        args.sizes, args.nrhs, args.orders, args.variants,
+        warmup=args.warmup, repeat=args.repeat, number=args.number,
+        verbose=not args.quiet,
+    )
+    if args.json:
+        write_json(records, args.json)
+    if args.csv:
+        write_csv(records, args.csv)
+    if args.baseline:
+        try:
+            check_baseline(records, load_records(args.baseline),
+                           args.tolerance)
+        except BenchmarkRegression as exc:
+            print(exc, file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Thread-scaling sweep for the solver benchmarks.
+
+The thread pools of the NAG engine and of the BLAS used by scipy are sized
+when the process starts, so every thread count is measured in a child
+process running solver_bench.py with the OpenMP/MKL/OpenBLAS thread
+variables set and, where the OS allows it, its CPU affinity pinned to that
+many cores.  The results give the speedup and parallel efficiency of each
+variant and size against one thread, and a recommended thread count for
+each band of sizes of every variant, number of right-hand sides and
+storage order.
+
+Example, from this directory:
+
+    python thread_scaling.py --sizes 500 1000 2000 4000 --threads 1 2 4 8 16
+"""
+# pylint: disable=invalid-name,too-many-arguments,too-many-locals
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import solver_bench
+
+BENCH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     'solver_bench.py')
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'OPENBLAS_NUM_THREADS')
+
+
+def available_cpus():
+    """
+    Return the CPUs this process may run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def default_thread_counts(max_threads=None):
+    """
+    Return 1, 2, 4, ... up to max_threads, which defaults to the CPU count.
+    """
+    max_threads = max_threads or len(available_cpus())
+    counts = []
+    t = 1
+    while t < max_threads:
+        counts.append(t)
+        t *= 2
+    counts.append(max_threads)
+    return counts
+
+
+def run_child(threads, sizes, variants, nrhs=(1,), orders=('F',), warmup=1,
+              repeat=5, pin=True):
+    """
+    Run solver_bench in a child process limited to threads threads.
+
+    Returns the benchmark records, each with a 'threads' key added.
+    """
+    env = dict(os.environ)
+    for var in THREAD_ENV_VARS:
+        env[var] = str(threads)
+
+    preexec_fn = None
+    if pin and hasattr(os, 'sched_setaffinity'):
+        cpus = available_cpus()[:threads]
+        preexec_fn = lambda: os.sched_setaffinity(0, cpus)
+
+    fd, path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        cmd = [sys.executable, BENCH, '--quiet', '--json', path,
+               '--warmup', str(warmup), '--repeat', str(repeat)]
+        cmd += ['--sizes'] + [str(n) for n in sizes]
+        cmd += ['--nrhs'] + [str(k) for k in nrhs]
+        cmd += ['--orders'] + list(orders)
+        cmd += ['--variants'] + list(variants)
+        subprocess.run(cmd, env=env, preexec_fn=preexec_fn, check=True,
+                       cwd=os.path.dirname(BENCH))
+        records = solver_bench.load_records(path)
+    finally:
+        os.remove(path)
+    for record in records:
+        record['threads'] = threads
+    return records
+
+
+def scaling_sweep(sizes, threads=None, variants=('scipy', 'nag_dgesv'),
+                  nrhs=(1,), orders=('F',), warmup=1, repeat=5, pin=True,
+                  verbose=False):
+    """
+    Benchmark every variant and size at every thread count.
+    """
+    records = []
+    for t in threads or default_thread_counts():
+        if verbose:
+            print('threads={}'.format(t))
+        records += run_child(t, sizes, variants, nrhs, orders, warmup,
+                             repeat, pin)
+    return records
+
+
+def scaling_table(records):
+    """
+    Add the speedup and parallel efficiency against the fewest threads.
+
+    Returns new records sorted by variant, n, nrhs, order and threads.
+    """
+    def key(r):
+        return (r['variant'], r['n'], r['nrhs'], r['order'])
+
+    serial = {}
+    for r in sorted(records, key=lambda r: r['threads']):
+        serial.setdefault(key(r), r)
+
+    table = []
+    for r in sorted(records, key=lambda r: key(r) + (r['threads'],)):
+        base = serial[key(r)]
+        speedup = base['median'] / r['median'] if r['median'] > 0 else 0.0
+        row = dict(r)
+        row['speedup'] = speedup
+        row['efficiency'] = speedup * base['threads'] / r['threads']
+        table.append(row)
+    return table
+
+
+def recommend(table, min_efficiency=0.5):
+    """
+    Recommend a thread count for each band of sizes of each case.
+
+    A case is a variant with one number of right-hand sides and one
+    storage order; cases are never compared with each other.  For every
+    size the recommendation is the fastest thread count whose parallel
+    efficiency is at least min_efficiency; consecutive sizes with the
+    same recommendation are merged into a band.  Returns a dict
+    (variant, nrhs, order) -> list of (smallest n, largest n, threads).
+    """
+    best = {}
+    for r in table:
+        if r['efficiency'] < min_efficiency:
+            continue
+        k = (r['variant'], r['nrhs'], r['order'], r['n'])
+        if k not in best or r['median'] < best[k]['median']:
+            best[k] = r
+
+    bands = {}
+    for (variant, nrhs, order, n), r in sorted(best.items()):
+        case_bands = bands.setdefault((variant, nrhs, order), [])
+        if case_bands and case_bands[-1][2] == r['threads']:
+            case_bands[-1] = (case_bands[-1][0], n, r['threads'])
+        else:
+            case_bands.append((n, n, r['threads']))
+    return bands
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[500, 1000, 2000, 4000])
+    parser.add_argument('--threads', type=int, nargs='+', default=None)
+    parser.add_argument('--variants', nargs='+',
+                        choices=solver_bench.VARIANTS,
+                        default=['scipy', 'nag_dgesv'])
+    parser.add_argument('--nrhs', type=int, nargs='+', default=[1])
+    parser.add_argument('--orders', nargs='+', choices=['C', 'F'],
+                        default=['F'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-efficiency', type=float, default=0.5)
+    parser.add_argument('--no-pin', action='store_true',
+                        help='do not restrict the CPU affinity of the children')
+    parser.add_argument('--json', help='write the scaling table to this file')
+    args = parser.parse_args(argv)
+
+    records = scaling_sweep(
+        args.sizes, args.threads, args.variants, args.nrhs, args.orders,
+        repeat=args.repeat, pin=not args.no_pin, verbose=True,
+    )
+    table = scaling_table(records)
+    for r in table:
+        print(
+            '{variant:20s} n={n:<6d} nrhs={nrhs:<4d} order={order} '
+            'threads={threads:<4d} median={median:.3e} '
+            'speedup={speedup:6.2f} efficiency={efficiency:5.2f}'.format(**r)
+        )
+    bands = recommend(table, args.min_efficiency)
+    print('Recommended threads (efficiency >= {}):'.format(
+        args.min_efficiency))
+    for (variant, nrhs, order), case_bands in bands.items():
+        for lo, hi, t in case_bands:
+            print('  {:20s} nrhs={:<4d} order={} n={}..{}: {}'.format(
+                variant, nrhs, order, lo, hi, t))
+    if args.json:
+        recommended = [
+            {'variant': variant, 'nrhs': nrhs, 'order': order,
+             'bands': case_bands}
+            for (variant, nrhs, order), case_bands in bands.items()
+        ]
+        with open(args.json, 'w') as f:
+            json.dump({'table': table, 'recommended': recommended}, f,
+                      indent=1)
+
+
+if __name__ == '__main__':
+    main()